@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 import argparse
+import hashlib
+import os
 import platform
 import tarfile
+import time
 import urllib.request as req
 from pathlib import Path
 from tempfile import NamedTemporaryFile
@@ -44,7 +47,43 @@ def _mamba_forge(dest_dir: Path) -> None:
     target.chmod(0o755)
 
 
-def _micromamba(dest_dir: Path) -> None:
+def _sha256(path: Path) -> str:
+    sha = hashlib.sha256()
+    with path.open("rb") as f_obj:
+        for chunk in iter(lambda: f_obj.read(1024**2), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _is_cached(target: Path, max_age: float) -> bool:
+    """Check if a valid micromamba binary has been downloaded before."""
+    checksum_file = target.with_suffix(".sha256")
+    if not target.is_file() or not checksum_file.is_file():
+        return False
+    if time.time() - checksum_file.stat().st_mtime > max_age * 86400:
+        return False
+    return checksum_file.read_text().strip() == _sha256(target)
+
+
+def _micromamba_release(target: Path, plt: str) -> None:
+    """Download the micromamba binary and check its published checksum."""
+    url = (
+        "https://github.com/mamba-org/micromamba-releases/releases/latest/"
+        f"download/micromamba-linux-{plt}"
+    )
+    with req.urlopen(f"{url}.sha256", timeout=30) as res:
+        checksum = res.read().decode().split()[0].strip()
+    temp_file = target.with_suffix(".tmp")
+    print("Retrieving micromamba: {}".format(url))
+    req.urlretrieve(url, filename=str(temp_file), reporthook=reporthook)
+    if _sha256(temp_file) != checksum:
+        temp_file.unlink()
+        raise ValueError("Checksum of the downloaded micromamba doesn't match.")
+    temp_file.chmod(0o755)
+    os.replace(temp_file, target)
+
+
+def _micromamba(dest_dir: Path, max_age: float = 30) -> None:
     system = platform.system().lower()
     plt = platform.machine()
     target = dest_dir / "bin" / "micromamba"
@@ -52,6 +91,18 @@ def _micromamba(dest_dir: Path) -> None:
         raise ValueError("Only Linux based deployment is supported.")
     if plt.startswith("x86"):
         plt = "64"
+    if _is_cached(target, max_age):
+        print("Using cached micromamba: {}".format(target))
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        _micromamba_release(target, plt)
+        target.with_suffix(".sha256").write_text(_sha256(target))
+        return
+    except ValueError:
+        raise
+    except Exception as error:
+        print("Could not download micromamba release: {}".format(error))
     with NamedTemporaryFile(suffix=".tar") as temp_f:
         _url_retrieve(
             f"https://micro.mamba.pm/api/micromamba/linux-{plt}/latest",
@@ -62,15 +113,18 @@ def _micromamba(dest_dir: Path) -> None:
             print("🔧 Extracting: bin/micromamba")
             tar.extract(member, path=str(dest_dir))
     target.chmod(0o755)
+    target.with_suffix(".sha256").write_text(_sha256(target))
 
 
-def download(mamba: str = "micromamba", dest_dir: Path = Path("/tmp")) -> None:
+def download(
+    mamba: str = "micromamba", dest_dir: Path = Path("/tmp"), max_age: float = 30
+) -> None:
     """Download the conda forge install script."""
     dest_dir.mkdir(parents=True, exist_ok=True)
     if "forge" in mamba:
         _mamba_forge(dest_dir)
     else:
-        _micromamba(dest_dir)
+        _micromamba(dest_dir, max_age)
 
 
 def _cli() -> argparse.ArgumentParser:
@@ -86,10 +140,16 @@ def _cli() -> argparse.ArgumentParser:
         default="micromamba",
         choices=("micromamba", "mambaforge"),
     )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=30,
+        help="Days after which a cached micromamba binary is updated.",
+    )
     args = parser.parse_args()
     return args
 
 
 if __name__ == "__main__":
     args = _cli()
-    download(args.type, args.target_path)
+    download(args.type, args.target_path, args.max_age)
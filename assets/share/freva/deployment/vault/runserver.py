@@ -10,6 +10,7 @@ Overview
 """
 
 import argparse
+import asyncio
 import base64
 import json
 import logging
@@ -17,14 +18,28 @@ import os
 import pathlib
 import random
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from subprocess import Popen
-from typing import Annotated, Dict, List, Optional, TypedDict, cast
+from typing import (
+    Annotated,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypedDict,
+    cast,
+)
 
 import hvac
 import requests
 from fastapi import Body, FastAPI, Header, HTTPException, Path, status
 from fastapi.responses import JSONResponse
+from requests.adapters import HTTPAdapter
 
 KeyType = TypedDict("KeyType", {"keys": List[str], "token": str})
 if os.getenv("KEY_FILE"):
@@ -40,6 +55,14 @@ elif os.getenv("CONDA_PREFIX"):
 else:
     KEY_FILE = pathlib.Path("/vault/file/keys")
 VAULT_ADDR = os.environ.get("VAULT_ADDR", "http://127.0.0.1:8200")
+POOL_SIZE = int(os.environ.get("VAULT_POOL_SIZE", "32"))
+TOKEN_CHECK_INTERVAL = float(
+    os.environ.get("VAULT_TOKEN_CHECK_INTERVAL", "300")
+)
+WORKERS = int(os.environ.get("VAULT_WORKERS", "16"))
+MAX_CONCURRENCY = int(os.environ.get("VAULT_MAX_CONCURRENCY", "64"))
+QUEUE_TIMEOUT = float(os.environ.get("VAULT_QUEUE_TIMEOUT", "10"))
+CACHE_TTL = float(os.environ.get("VAULT_CACHE_TTL", "60"))
 POLICY = """
     path "secret" {
         capabilities = ["create", "read", "update", "delete", "list"]
@@ -119,40 +142,150 @@ class VaultClient:
     """The number of shares required to reconstruct the master key."""
     secret_shares: int = 5
     """The number of shares to split the master key into."""
-    client = hvac.Client(
-        url=VAULT_ADDR,
+    session = requests.Session()
+    session.mount(
+        "http://", HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    )
+    session.mount(
+        "https://", HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
     )
+    client = hvac.Client(url=VAULT_ADDR, session=session)
     keys: KeyType = {"token": "", "keys": []}
+    _key_mtime: Optional[int] = None
+    _token_expires: float = 0.0
+    _auth_lock = threading.Lock()
 
     def __init__(self) -> None:
         prefix = "VAULT_ADD_VAR_"
         self.add_keys = {}
+        self._cache: Dict[str, Tuple[float, Dict[str, str]]] = {}
+        self._cache_lock = threading.Lock()
+        # A fixed set of locks that paths are hashed onto, one lock per path
+        # would grow with every path that has ever been read.
+        self._path_locks = [
+            threading.Lock() for _ in range(4 * max(WORKERS, 1))
+        ]
+        self.cache_hits = 0
+        self.cache_misses = 0
         for key, value in os.environ.items():
             if key.startswith(prefix):
                 k = key.removeprefix(prefix).lower().replace("_", ".")
                 self.add_keys[k] = value
 
-    def _auth_vault(self) -> None:
-        if not self.client.is_authenticated():
-            keys = self.unseal()
-            self.client.token = keys.get("token")
+    def _auth_vault(self, force: bool = False) -> None:
+        """Make sure the client has a valid token.
+
+        The validity of the token is remembered for its ttl, but at most
+        ``TOKEN_CHECK_INTERVAL`` seconds, to save a round trip to the vault
+        on every request.
+        """
+        if not force and self._token_valid:
+            return
+        with self._auth_lock:
+            if not force and self._token_valid:
+                return
+            try:
+                data = self.client.auth.token.lookup_self()["data"]
+                ttl = data.get("ttl") or TOKEN_CHECK_INTERVAL
+            except (
+                hvac.exceptions.VaultError,
+                requests.exceptions.RequestException,
+            ):
+                keys = self.unseal()
+                self.client.token = keys.get("token")
+                ttl = TOKEN_CHECK_INTERVAL if self.client.token else 0
+            VaultClient._token_expires = time.monotonic() + min(
+                ttl, TOKEN_CHECK_INTERVAL
+            )
+
+    @property
+    def _token_valid(self) -> bool:
+        """Check if the token was valid the last time it was looked up."""
+        return bool(self.client.token) and (
+            time.monotonic() < self._token_expires
+        )
+
+    def _call(
+        self, method: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> Any:
+        """Call the vault, re-authenticate if access is denied."""
+        self._auth_vault()
+        try:
+            return method(*args, **kwargs)
+        except (hvac.exceptions.Forbidden, hvac.exceptions.VaultDown):
+            # The token expired or the vault has been sealed.
+            self._auth_vault(force=True)
+            return method(*args, **kwargs)
+
+    def _path_lock(self, path: str) -> threading.Lock:
+        """Get the lock that serialises the vault access of a path."""
+        return self._path_locks[hash(path) % len(self._path_locks)]
 
     def update_secret(self, path: str, **secret: str) -> None:
         """Update or create a secret."""
-        self._auth_vault()
-        old_secret = self.get_secret(path) or {}
-        old_secret.update(secret)
-        self.client.secrets.kv.v1.create_or_update_secret(
-            path=path, secret=old_secret
-        )
+        # Hold the path lock, a concurrent read would otherwise cache the
+        # secret from before the update.
+        with self._path_lock(path):
+            old_secret = self.get_secret(path) or {}
+            old_secret.update(secret)
+            try:
+                self._call(
+                    self.client.secrets.kv.v1.create_or_update_secret,
+                    path=path,
+                    secret=old_secret,
+                )
+            finally:
+                with self._cache_lock:
+                    self._cache.pop(path, None)
+
+    def read_secret(self, path: str) -> Optional[Dict[str, str]]:
+        """Get the secrets of a path, served from the cache if possible.
+
+        Secrets are cached for ``CACHE_TTL`` seconds. Updates through this
+        process drop the cached secrets immediately, updates through other
+        workers are picked up once the cached secrets expire. Expired
+        secrets are removed from the cache on every cache miss.
+        """
+        # Only one thread per path asks the vault, the others wait for it.
+        with self._path_lock(path):
+            with self._cache_lock:
+                now = time.monotonic()
+                expires, data = self._cache.get(path, (0.0, {}))
+                if now < expires:
+                    self.cache_hits += 1
+                    return dict(data)
+                self.cache_misses += 1
+                # Drop all expired secrets, not only the one of this path.
+                for key in [k for k, v in self._cache.items() if v[0] <= now]:
+                    del self._cache[key]
+            secret = self.get_secret(path)
+            if secret is not None and CACHE_TTL > 0:
+                with self._cache_lock:
+                    self._cache[path] = (
+                        time.monotonic() + CACHE_TTL,
+                        dict(secret),
+                    )
+            return secret
+
+    @property
+    def cache_info(self) -> Dict[str, float]:
+        """Get the statistics of the secret cache."""
+        with self._cache_lock:
+            return {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "size": len(self._cache),
+                "max_age": CACHE_TTL,
+            }
 
     def get_secret(self, path: str) -> Optional[Dict[str, str]]:
         """Get the secretes of a path."""
-        self._auth_vault()
         try:
             return cast(
                 Optional[Dict[str, str]],
-                self.client.secrets.kv.v1.read_secret(path).get("data"),
+                self._call(self.client.secrets.kv.v1.read_secret, path).get(
+                    "data"
+                ),
             )
         except hvac.exceptions.VaultError:
             logger.warning("Could not find secret path: %s", path)
@@ -182,10 +315,19 @@ class VaultClient:
                 "Vault is initialized but the key file does not exist"
             )
             return {"token": "", "keys": []}
-        return cast(
-            KeyType,
-            json.loads(base64.b64decode(KEY_FILE.read_bytes())),
-        )
+        return cls._read_keys()
+
+    @classmethod
+    def _read_keys(cls) -> KeyType:
+        """Read the key file, only if it changed since it was last read."""
+        mtime = KEY_FILE.stat().st_mtime_ns
+        if mtime != cls._key_mtime:
+            cls.keys = cast(
+                KeyType,
+                json.loads(base64.b64decode(KEY_FILE.read_bytes())),
+            )
+            cls._key_mtime = mtime
+        return cls.keys
 
     @property
     def vault_state(self) -> str:
@@ -229,13 +371,50 @@ class VaultClient:
 
 
 Vault = VaultClient()
+EXECUTOR = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="vault")
+_limit: Optional[asyncio.Semaphore] = None
+
+
+async def _run(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking vault call in the thread pool.
+
+    At most ``MAX_CONCURRENCY`` calls are running or waiting for a thread,
+    requests that can't get a slot within ``QUEUE_TIMEOUT`` seconds are
+    rejected.
+    """
+    global _limit
+    if _limit is None:
+        _limit = asyncio.Semaphore(MAX_CONCURRENCY)
+    try:
+        await asyncio.wait_for(_limit.acquire(), QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            detail=random.choice(PHRASES),
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": "1"},
+        ) from None
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            EXECUTOR, partial(func, *args, **kwargs)
+        )
+    finally:
+        _limit.release()
+
+
+def _get_vault_state() -> str:
+    return Vault.vault_state
 
 
 @app.get("/vault/status", tags=["Secrets"])
 async def get_vault_status() -> JSONResponse:
     """Get the status of the vault."""
     return JSONResponse(
-        content={"status": Vault.vault_state, "version": VERSION}, status_code=200
+        content={
+            "status": await _run(_get_vault_state),
+            "version": VERSION,
+            "cache": Vault.cache_info,
+        },
+        status_code=200,
     )
 
 
@@ -281,7 +460,7 @@ async def update_secret(
             status_code=status.HTTP_204_NO_CONTENT,
         )
     try:
-        Vault.update_secret(path, **secrets)
+        await _run(Vault.update_secret, path, **secrets)
     except hvac.exceptions.VaultError:
         logger.warning("Could not add secrets %s to %s", path, secrets)
         raise HTTPException(
@@ -313,12 +492,12 @@ async def read_secret(
     """Read evaluation system secrets from the vault."""
     status_code = 400
     if len(public_key) != 128:  # This is not a checksum of a cert.
-        text = f"But the vault is {Vault.vault_state}"
+        text = f"But the vault is {await _run(_get_vault_state)}"
         raise HTTPException(
             detail=f"{random.choice(PHRASES)} {text}", status_code=status_code
         ) from None
     # Get the information from the vault
-    data = Vault.get_secret(path)
+    data = await _run(Vault.read_secret, path)
     if data is not None:
         status_code = 200
     return JSONResponse(content=data or {}, status_code=status_code)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Check the start up time of the deploy-freva command line interface.
+
+Every command is run in a fresh interpreter with ``python -X importtime``.
+The script fails if a command imports modules it doesn't need or if the
+accumulated import time exceeds its budget.
+
+Usage::
+
+    python benchmarks/import_time.py [--budget-scale 2]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+HEAVY_MODULES = (
+    "ansible",
+    "cryptography",
+    "freva_deployment.deploy",
+    "freva_deployment.runner",
+    "npyscreen",
+    "paramiko",
+    "pymysql",
+)
+"""Modules that are only needed for deploying or migrating."""
+
+Benchmark = NamedTuple(
+    "Benchmark",
+    [
+        ("argv", Tuple[str, ...]),
+        ("budget", Optional[float]),
+        ("forbidden", Tuple[str, ...]),
+    ],
+)
+
+BENCHMARKS = (
+    Benchmark(("--help",), 500.0, HEAVY_MODULES),
+    Benchmark(("config", "--help"), 500.0, HEAVY_MODULES),
+    Benchmark(("compose", "--help"), None, ()),
+    Benchmark(("cmd", "--help"), None, ()),
+)
+"""The commands, their import time budget in ms and forbidden modules."""
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(argv: Tuple[str, ...]) -> Dict[str, Tuple[float, float]]:
+    """Get the self and cumulative import time (ms) of all imported modules.
+
+    Raises
+    ------
+    RuntimeError:
+        If the command failed.
+    """
+    code = (
+        "from freva_deployment.cli import main_cli\n"
+        f"main_cli({list(argv)!r})"
+    )
+    env = os.environ.copy()
+    env.pop("PYTHONPROFILEIMPORTTIME", None)
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        env=env,
+    )
+    modules: Dict[str, Tuple[float, float]] = {}
+    errors: List[str] = []
+    for line in res.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules[name] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+        else:
+            errors.append(line)
+    if res.returncode != 0:
+        raise RuntimeError("\n".join(errors[-5:]))
+    return modules
+
+
+def check(benchmark: Benchmark, scale: float, top: int) -> List[str]:
+    """Run a benchmark, return the problems that were found."""
+    command = " ".join(("deploy-freva",) + benchmark.argv)
+    try:
+        modules = measure(benchmark.argv)
+    except RuntimeError as error:
+        return [f"{command} failed:\n{error}"]
+    total = sum(t[0] for t in modules.values())
+    print(f"{command}: {len(modules)} modules, {total:.1f} ms")
+    for name, (_, cumulative) in sorted(
+        modules.items(), key=lambda m: m[1][1], reverse=True
+    )[:top]:
+        print(f"    {cumulative:8.1f} ms  {name}")
+    problems = []
+    for name in modules:
+        if name.split(".")[0] in benchmark.forbidden or name in benchmark.forbidden:
+            problems.append(f"{command} imports {name}")
+    if benchmark.budget is not None and total > benchmark.budget * scale:
+        problems.append(
+            f"{command} took {total:.1f} ms to import, "
+            f"the budget is {benchmark.budget * scale:.1f} ms"
+        )
+    return problems
+
+
+def main() -> None:
+    """Run all benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--budget-scale",
+        type=float,
+        default=float(os.getenv("DEPLOY_FREVA_IMPORT_BUDGET_SCALE", "1")),
+        help="Multiply all budgets by this factor, for slow machines.",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=5,
+        help="Number of the slowest imports that are displayed.",
+    )
+    args = parser.parse_args()
+    problems = []
+    for benchmark in BENCHMARKS:
+        problems += check(benchmark, args.budget_scale, args.top)
+    for problem in problems:
+        print(f"ERROR: {problem}", file=sys.stderr)
+    if problems:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
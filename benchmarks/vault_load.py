@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Drive concurrent secret reads against the vault restAPI.
+
+A local stub that answers like a vault server, with an artificial latency,
+is started together with the restAPI of ``vault/runserver.py``. The script
+then sends concurrent ``read_secret`` requests and reports the throughput
+and latencies. It needs the packages of ``vault/requirements.txt``.
+
+Usage::
+
+    python benchmarks/vault_load.py [--requests 2000] [--concurrency 64]
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, List, Tuple
+
+RUNSERVER = (
+    Path(__file__).parent.parent
+    / "assets"
+    / "share"
+    / "freva"
+    / "deployment"
+    / "vault"
+    / "runserver.py"
+)
+"""The vault restAPI that is tested."""
+
+SECRET = {"db.host": "localhost", "db.port": "3306", "db.user": "freva"}
+
+
+class StubVault(BaseHTTPRequestHandler):
+    """Answer the vault requests that are made by the restAPI."""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.02
+    calls = 0
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Answer token lookups, seal status and kv reads."""
+        StubVault.calls += 1
+        time.sleep(self.latency)
+        if self.path.startswith("/v1/auth/token/lookup-self"):
+            body: Any = {"data": {"ttl": 0}}
+        elif self.path.startswith("/v1/sys/seal-status"):
+            body = {"sealed": False, "initialized": True}
+        elif self.path.startswith("/v1/secret/"):
+            body = {"data": SECRET}
+        else:
+            self.send_error(404)
+            return
+        content = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args: Any) -> None:
+        """Don't log the requests."""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def start_servers(latency: float) -> str:
+    """Start the vault stub and the restAPI, return the url of the api."""
+    StubVault.latency = latency
+    stub = ThreadingHTTPServer(("127.0.0.1", _free_port()), StubVault)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    os.environ["VAULT_ADDR"] = f"http://127.0.0.1:{stub.server_port}"
+    spec = importlib.util.spec_from_file_location("runserver", RUNSERVER)
+    assert spec is not None and spec.loader is not None
+    runserver = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(runserver)
+    runserver.Vault.client.token = "stub-token"
+
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(runserver.app, port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def run(url: str, requests: int, concurrency: int) -> Tuple[float, List[float]]:
+    """Send concurrent reads, return the duration and the latencies."""
+    import requests as http
+
+    session = http.Session()
+    adapter = http.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    path = f"{url}/vault/data/{'0' * 128}"
+
+    def read(_: int) -> float:
+        start = time.perf_counter()
+        res = session.get(path, timeout=60)
+        res.raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(read, range(requests)))
+    return time.perf_counter() - start, latencies
+
+
+def main() -> None:
+    """Run the load test."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=2000,
+        help="Number of requests that are sent.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=64,
+        help="Number of requests that are sent at the same time.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.02,
+        help="Seconds the vault stub needs to answer a request.",
+    )
+    args = parser.parse_args()
+    url = start_servers(args.latency)
+    duration, latencies = run(url, args.requests, args.concurrency)
+    latencies.sort()
+    print(
+        f"{args.requests} requests in {duration:.2f}s "
+        f"({args.requests / duration:.0f} req/s), "
+        f"{StubVault.calls} vault calls"
+    )
+    for name, value in (
+        ("median", statistics.median(latencies)),
+        ("p95", latencies[int(len(latencies) * 0.95) - 1]),
+        ("max", latencies[-1]),
+    ):
+        print(f"    {name:>6}: {value * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
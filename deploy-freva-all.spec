@@ -37,6 +37,17 @@ for bin in ("mysqldump",):
 # Hidden imports
 # ---------------------------------------------------
 hiddenimports = ["tomlkit", "cryptography", "ansible_pylibssh", "ansible"]
+# The sub commands of the cli and optional features are imported lazily.
+hiddenimports += [
+    "freva_deployment.cli._compose",
+    "freva_deployment.cli._config",
+    "freva_deployment.cli._deploy",
+    "freva_deployment.cli._kubernets",
+    "freva_deployment.cli._migrate",
+    "freva_deployment.conda_lock",
+    "freva_deployment.image_mirror",
+    "freva_deployment.ui.deployment_tui",
+]
 
 # ---------------------------------------------------
 # Data files
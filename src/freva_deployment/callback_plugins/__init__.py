@@ -0,0 +1,6 @@
+"""Ansible callback plugins of the deployment."""
+
+from typing import Any, Optional
+
+event_queue: Optional[Any] = None
+"""Queue the deployment plugin sends its log events to instead of a file."""
@@ -2,7 +2,7 @@
 
 from __future__ import absolute_import, division, print_function
 
-from typing import IO, Optional
+from typing import IO
 
 __metaclass__ = type
 
@@ -20,9 +20,32 @@ DOCUMENTATION = """
             default: temporary file
             type: str
             description:
-                - Set the path to the log file.
+                - Set the path to the log file, events are sent to the
+                  deployment process instead if no path is set and the
+                  plugin runs within the deployment.
             env:
-                - name: ANSIBLE_LOG_PATH
+                - name: DEPLOYMENT_LOG_PATH
+        log_format:
+            default: json
+            type: str
+            description:
+                - Format of the log events, json lines or msgpack.
+            env:
+                - name: DEPLOYMENT_LOG_FORMAT
+        flush_interval:
+            default: 1
+            type: float
+            description:
+                - Maximum time in seconds log events are buffered.
+            env:
+                - name: DEPLOYMENT_LOG_FLUSH_INTERVAL
+        buffer_size:
+            default: 65536
+            type: int
+            description:
+                - Maximum size in bytes of buffered log events.
+            env:
+                - name: DEPLOYMENT_LOG_BUFFER_SIZE
     extends_documentation_fragment:
       - default_callback
     requirements:
@@ -30,15 +53,22 @@ DOCUMENTATION = """
 """
 import json
 import os
+import time
 from tempfile import NamedTemporaryFile
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from ansible.constants import MODULE_NO_JSON
+from ansible.executor.stats import AggregateStats
 from ansible.executor.task_result import TaskResult
-from ansible.plugins.callback import (
-    module_response_deepcopy,
-    strip_internal_keys,
-)
+from ansible.inventory.host import Host
+from ansible.playbook.play import Play
+from ansible.playbook.task import Task
+
+_MSGPACK = True
+try:
+    import msgpack
+except ImportError:
+    _MSGPACK = False
 
 # -----------------------------------------------------------------------------
 # Select a YAML-style base callback that works with multiple Ansible versions
@@ -61,10 +91,34 @@ except Exception:
         )
 
 
+def _strip_internal_keys(value: Any) -> Any:
+    """Create a copy of a task result without ansible internal keys.
+
+    Only containers are copied, the values are shared with the original.
+    """
+    if isinstance(value, dict):
+        return {
+            k: _strip_internal_keys(v)
+            for k, v in value.items()
+            if not (isinstance(k, str) and k.startswith("_ansible_"))
+        }
+    if isinstance(value, (list, tuple)):
+        return [_strip_internal_keys(v) for v in value]
+    return value
+
+
 class CallbackModule(BaseYamlCallback):
     """
-    Custom Ansible callback plugin that logs output to a file in single-line JSON format
-    and displays output to stdout in YAML format.
+    Custom Ansible callback plugin that logs events to a file and displays
+    output to stdout in YAML format.
+
+    Every event is written as a single-line JSON string (or a msgpack record),
+    task results carry the host and the start and end time of the task.
+    If the plugin runs in a playbook that was started by the deployment, the
+    events are sent to the deployment process instead of a log file.
+    Events are buffered and written once the buffer exceeds
+    ``DEPLOYMENT_LOG_BUFFER_SIZE`` bytes or ``DEPLOYMENT_LOG_FLUSH_INTERVAL``
+    seconds have passed.
 
     Attributes
     ----------
@@ -74,7 +128,7 @@ class CallbackModule(BaseYamlCallback):
         Type of the callback plugin.
     CALLBACK_NAME : str
         Name of the callback plugin.
-    log_file : IO
+    log_file : IO, None
         File object for the log file.
     """
 
@@ -91,33 +145,124 @@ class CallbackModule(BaseYamlCallback):
         display : Optional[Display], optional
             Ansible display object for managing console output, by default None.
         """
-        log_file = (
-            os.getenv("DEPLOYMENT_LOG_PATH")
-            or NamedTemporaryFile(suffix=".log", delete=False).name
+        try:
+            from freva_deployment.callback_plugins import event_queue
+        except ImportError:
+            event_queue = None
+        self._queue = event_queue
+        log_file = os.getenv("DEPLOYMENT_LOG_PATH") or (
+            NamedTemporaryFile(suffix=".log", delete=False).name
+            if self._queue is None
+            else ""
+        )
+        self.log_format = os.getenv("DEPLOYMENT_LOG_FORMAT", "json").lower()
+        if self.log_format == "msgpack" and not _MSGPACK:
+            self.log_format = "json"
+        self.flush_interval = float(
+            os.getenv("DEPLOYMENT_LOG_FLUSH_INTERVAL", "1")
         )
-        self.log_file: IO[str] = open(log_file, "w")
+        self.buffer_size = int(os.getenv("DEPLOYMENT_LOG_BUFFER_SIZE", "65536"))
+        self.log_file: Optional[IO[Any]] = None
+        if log_file:
+            self.log_file = open(
+                log_file, "wb" if self.log_format == "msgpack" else "w"
+            )
+        self._buffer: List[Union[str, bytes]] = []
+        self._buffered_bytes = 0
+        self._last_flush = time.time()
+        self._start_times: Dict[Tuple[str, str], float] = {}
+        self._play_name = ""
         super().__init__()
         self._plugin_options["result_format"] = "yaml"
         self._plugin_options["pretty_results"] = True
 
-    def log_result(self, result: TaskResult) -> None:
+    def write_event(self, event: Dict[str, Any], flush: bool = False) -> None:
+        """
+        Add an event to the log buffer.
+
+        Parameters
+        ----------
+        event : dict
+            The event that should be logged.
+        flush : bool, default: False
+            Write the buffer to the log file immediately.
         """
-        Logs the result as a single-line JSON string to the log file.
+        record: Union[str, bytes]
+        if self.log_format == "msgpack":
+            record = msgpack.packb(event, default=str)
+        else:
+            record = json.dumps(event, default=str) + "\n"
+        self._buffer.append(record)
+        self._buffered_bytes += len(record)
+        if (
+            flush
+            or self._buffered_bytes >= self.buffer_size
+            or time.time() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all buffered events to the log file."""
+        if self._buffer and self._queue is not None:
+            self._queue.put(self._buffer)
+        if self._buffer and self.log_file and not self.log_file.closed:
+            join = b"" if self.log_format == "msgpack" else ""
+            self.log_file.write(join.join(self._buffer))  # type: ignore
+            self.log_file.flush()
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._last_flush = time.time()
+
+    def log_result(self, result: TaskResult, event: str = "runner_on_ok") -> None:
+        """
+        Logs the result of a task.
 
         Parameters
         ----------
         result : TaskResult
             Ansible task result object.
+        event : str, default: runner_on_ok
+            The type of the result.
         """
-        dump = {
-            "task": result.task_name,
-            "result": strip_internal_keys(
-                module_response_deepcopy(result._result)
-            ),
-        }
-        single_line_json = json.dumps(dump).replace("\n", "").replace("\r", "")
-        self.log_file.write(single_line_json + "\n")
-        self.log_file.flush()
+        host = result._host.get_name()
+        end = time.time()
+        start = self._start_times.pop((host, result._task._uuid), end)
+        role = result._task._role
+        self.write_event(
+            {
+                "event": event,
+                "task": result.task_name,
+                "action": result._task.action,
+                "role": role.get_name() if role else "",
+                "play": self._play_name,
+                "host": host,
+                "start": start,
+                "end": end,
+                "result": _strip_internal_keys(result._result),
+            }
+        )
+
+    def v2_playbook_on_play_start(self, play: Play) -> None:
+        self._play_name = play.get_name().strip()
+        self.write_event(
+            {
+                "event": "playbook_on_play_start",
+                "play": self._play_name,
+                "time": time.time(),
+            },
+            flush=True,
+        )
+        super().v2_playbook_on_play_start(play)
+
+    def v2_playbook_on_task_start(self, task: Task, is_conditional: bool) -> None:
+        # Make the results of the previous task available before a new,
+        # potentially long running, task starts.
+        self.flush()
+        super().v2_playbook_on_task_start(task, is_conditional)
+
+    def v2_runner_on_start(self, host: Host, task: Task) -> None:
+        self._start_times[(host.get_name(), task._uuid)] = time.time()
+        super().v2_runner_on_start(host, task)
 
     def v2_runner_on_ok(self, result: TaskResult) -> None:
         if (
@@ -135,8 +280,38 @@ class CallbackModule(BaseYamlCallback):
             self.log_result(result)
         super().v2_runner_on_async_ok(result)
 
+    def v2_runner_on_failed(
+        self, result: TaskResult, ignore_errors: bool = False
+    ) -> None:
+        self.log_result(result, "runner_on_failed")
+        super().v2_runner_on_failed(result, ignore_errors=ignore_errors)
+
+    def v2_runner_on_skipped(self, result: TaskResult) -> None:
+        self.log_result(result, "runner_on_skipped")
+        super().v2_runner_on_skipped(result)
+
+    def v2_runner_on_unreachable(self, result: TaskResult) -> None:
+        self.log_result(result, "runner_on_unreachable")
+        super().v2_runner_on_unreachable(result)
+
+    def v2_playbook_on_stats(self, stats: AggregateStats) -> None:
+        self.write_event(
+            {
+                "event": "playbook_on_stats",
+                "time": time.time(),
+                "stats": {
+                    host: stats.summarize(host)
+                    for host in sorted(stats.processed.keys())
+                },
+            },
+            flush=True,
+        )
+        super().v2_playbook_on_stats(stats)
+
     def __del__(self) -> None:
         """
         Closes the log file when the callback plugin is destroyed.
         """
-        self.log_file.close()
+        self.flush()
+        if self.log_file:
+            self.log_file.close()
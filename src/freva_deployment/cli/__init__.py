@@ -4,7 +4,8 @@ import argparse
 import importlib
 import os
 import shutil
-from typing import List, Optional
+import sys
+from typing import Dict, List, Optional, Tuple
 
 os.environ["ANSIBLE_COW_PATH"] = os.getenv(
     "ANSIBLE_COW_PATH", shutil.which("cowsay") or ""
@@ -13,24 +14,59 @@ os.environ["ANSIBLE_COW_PATH"] = os.getenv(
 from rich_argparse import ArgumentDefaultsRichHelpFormatter
 
 from freva_deployment import __version__
-from freva_deployment.ui.deployment_tui import tui
-from freva_deployment.versions import VersionAction, display_versions
-
-from ._compose import compose_parser
-from ._config import config_parser
-from ._deploy import BatchParser
-from ._deploy import cli as deploy
-from ._kubernets import kubernetes_parser
-from ._migrate import cli as migrate
-from ._migrate import create_parser as migrate_parser
+from freva_deployment.versions import VersionAction
 
 __all__ = ["deploy", "migrate"]
 
+SUB_COMMANDS: Dict[str, Tuple[str, str, Dict[str, str]]] = {
+    "cmd": (
+        "_deploy",
+        "BatchParser",
+        {
+            "help": "Run deployment in batch mode.",
+            "description": "Run deployment in batch mode.",
+        },
+    ),
+    "config": (
+        "_config",
+        "config_parser",
+        {"help": "Create and inspect freva configuration."},
+    ),
+    "compose": ("_compose", "compose_parser", {"help": "Create a compose file."}),
+    "kubernetes": (
+        "_kubernets",
+        "kubernetes_parser",
+        {"help": "Create a k8s manifests for deployment."},
+    ),
+    "migrate": (
+        "_migrate",
+        "create_parser",
+        {"help": "Utilities to handle migrations from the legacy freva."},
+    ),
+}
+"""The module, the parser constructor and the help of each sub command.
+
+Sub command modules are only imported if the sub command is used.
+"""
+
 
 def __getattr__(name):
     return getattr(importlib.import_module(f"._{name}", __name__), "cli")
 
 
+def _get_sub_command(argv: Optional[List[str]]) -> Optional[str]:
+    """Get the name of the sub command that is called, if any."""
+    for arg in sys.argv[1:] if argv is None else argv:
+        if not arg.startswith("-"):
+            return arg if arg in SUB_COMMANDS else None
+    return None
+
+
+def tui(args: argparse.Namespace) -> None:
+    """Run the text user interface."""
+    importlib.import_module("freva_deployment.ui.deployment_tui").tui(args)
+
+
 def main_cli(argv: Optional[List[str]] = None) -> None:
     """Construct command line argument parser."""
     app = argparse.ArgumentParser(
@@ -46,8 +82,8 @@ def main_cli(argv: Optional[List[str]] = None) -> None:
         "-V",
         "--version",
         action=VersionAction,
-        version="[b][red]%(prog)s[/red] {version}[/b]{services}".format(
-            version=__version__, services=display_versions()
+        version="[b][red]%(prog)s[/red] {version}[/b]%(services)s".format(
+            version=__version__
         ),
     )
     app.add_argument(
@@ -60,42 +96,16 @@ def main_cli(argv: Optional[List[str]] = None) -> None:
     subparser = app.add_subparsers(
         required=False,
     )
-    _ = BatchParser(
-        subparser.add_parser(
-            name="cmd",
-            help="Run deployment in batch mode.",
-            description="Run deployment in batch mode.",
-            formatter_class=ArgumentDefaultsRichHelpFormatter,
-        )
-    )
-    config_parser(
-        parser=subparser.add_parser(
-            name="config",
-            help="Create and inspect freva configuration.",
+    command = _get_sub_command(argv)
+    for name, (module, constructor, kwargs) in SUB_COMMANDS.items():
+        parser = subparser.add_parser(
+            name=name,
             formatter_class=ArgumentDefaultsRichHelpFormatter,
+            **kwargs,
         )
-    )
-    compose_parser(
-        parser=subparser.add_parser(
-            name="compose",
-            help="Create a compose file.",
-            formatter_class=ArgumentDefaultsRichHelpFormatter,
-        )
-    )
-    kubernetes_parser(
-        parser=subparser.add_parser(
-            name="kubernetes",
-            help="Create a k8s manifests for deployment.",
-            formatter_class=ArgumentDefaultsRichHelpFormatter,
-        )
-    )
-    migrate_parser(
-        parser=subparser.add_parser(
-            name="migrate",
-            help="Utilities to handle migrations from the legacy freva.",
-            formatter_class=ArgumentDefaultsRichHelpFormatter,
-        )
-    )
+        if name == command:
+            mod = importlib.import_module(f".{module}", __name__)
+            getattr(mod, constructor)(parser=parser)
 
     args = app.parse_args(argv)
     args.cli(args)
@@ -16,7 +16,7 @@ from ..deploy import DeployFactory
 from ..error import DeploymentError
 from ..logger import set_log_level
 from ..utils import config_dir
-from ..versions import VersionAction, display_versions
+from ..versions import VersionAction
 
 
 def _get_default_extra() -> List[Tuple[str, str]]:
@@ -114,8 +114,8 @@ class BatchParser:
             "-V",
             "--version",
             action=VersionAction,
-            version="[b][red]%(prog)s[/red] {version}[/b]{services}".format(
-                version=__version__, services=display_versions()
+            version="[b][red]%(prog)s[/red] {version}[/b]%(services)s".format(
+                version=__version__
             ),
         )
         self.parser.add_argument(
@@ -162,6 +162,50 @@ class BatchParser:
             action="store_true",
             help="Inspect all config values and exit.",
         )
+        self.parser.add_argument(
+            "-j",
+            "--max-workers",
+            type=int,
+            default=int(os.getenv("DEPLOY_FREVA_MAX_WORKERS", "1")),
+            help=(
+                "Maximum number of services that are deployed in parallel. "
+                "Only services that don't depend on each other and don't "
+                "share hosts are deployed at the same time."
+            ),
+        )
+        self.parser.add_argument(
+            "--profile",
+            type=Path,
+            nargs="?",
+            const=Path("deploy-freva-profile.txt"),
+            default=None,
+            help=(
+                "Profile the deployment. A summary of the most time consuming "
+                "tasks is displayed and the timings are saved in collapsed "
+                "stack format (flamegraph, speedscope) to this file."
+            ),
+        )
+        self.parser.add_argument(
+            "-f",
+            "--force",
+            action="store_true",
+            default=False,
+            help=(
+                "Deploy all selected steps. By default steps whose "
+                "configuration, roles and versions haven't changed since "
+                "their last deployment are skipped."
+            ),
+        )
+        self.parser.add_argument(
+            "--image-mirror",
+            action="store_true",
+            default=os.getenv("DEPLOY_FREVA_IMAGE_MIRROR", "0").lower()
+            in ("1", "true", "yes", "on"),
+            help=(
+                "Pull the container images once on this machine and copy "
+                "them to the hosts, instead of pulling them on every host."
+            ),
+        )
         self.parser.add_argument(
             "--cowsay",
             action="store_true",
@@ -201,6 +245,10 @@ class BatchParser:
                     tags=args.tags or None,
                     local=args.local,
                     extra=extra,
+                    max_workers=args.max_workers,
+                    profile=args.profile,
+                    force=args.force,
+                    image_mirror=args.image_mirror,
                 )
             except KeyboardInterrupt:
                 raise SystemExit(130)
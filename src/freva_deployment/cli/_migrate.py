@@ -5,22 +5,40 @@ from __future__ import annotations
 import argparse
 import json
 import os
+import re
 import shlex
 import shutil
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from subprocess import PIPE, CalledProcessError, run
-from tempfile import NamedTemporaryFile, TemporaryDirectory
-from typing import Optional, TextIO, cast
+from subprocess import DEVNULL, PIPE, CalledProcessError, Popen, run
+from tempfile import TemporaryDirectory, TemporaryFile
+from typing import IO, Any, Dict, List, Optional, TextIO, Tuple, cast
 
 import pymysql
 import toml
+from rich.progress import (
+    BarColumn,
+    DownloadColumn,
+    MofNCompleteColumn,
+    Progress,
+    TaskID,
+    TextColumn,
+    TimeElapsedColumn,
+    TransferSpeedColumn,
+)
 from rich_argparse import ArgumentDefaultsRichHelpFormatter
 
 from freva_deployment import __version__
 
+from ..error import DeploymentError
 from ..logger import logger, set_log_level
-from ..utils import read_db_credentials
+from ..schema import apply_schema_patches
+from ..utils import RichConsole, read_db_credentials
+
+CHUNK_SIZE = 1024**2
+"""Number of bytes that are passed from the dump to the import at once."""
 
 DUMP_SCRIPT = """#!{python_bin}
 import json
@@ -82,16 +100,8 @@ def _get_python_path_from_env() -> Path:
     return Path(python_path)
 
 
-def _add_new_db(db_config: dict[str, str], dump_file: str) -> None:
-    dump_cmd = (
-        f"mariadb --ssl=0 -h {db_config['db.host']} -u {db_config['db.user']} "
-        f"-p'{db_config['db.passwd']}' -P{db_config['db.port']} < {dump_file}"
-    )
-    logger.debug("Executing command: %s", dump_cmd)
-    res = os.system(dump_cmd)
-    if res != 0:
-        logger.error("Command failed: %s", dump_cmd)
-        return
+def _add_new_db(db_config: dict[str, str]) -> None:
+    """Adjust the schema of a migrated database."""
     with pymysql.connect(
         autocommit=True,
         host=db_config["db.host"],
@@ -99,46 +109,493 @@ def _add_new_db(db_config: dict[str, str], dump_file: str) -> None:
         password=db_config["db.passwd"],
         port=int(db_config["db.port"]),
         db=db_config["db.db"],
+    ) as con:
+        apply_schema_patches(con, db_config["db.db"])
+
+
+def _get_tables(parser: argparse.Namespace) -> Tuple[List[str], List[str]]:
+    """Get the tables and views of the old database, biggest tables first."""
+    with pymysql.connect(
+        host=parser.old_hostname,
+        user=parser.old_user,
+        password=parser.old_pw or "",
+        port=parser.old_port,
+        db=parser.old_db,
     ) as con:
         with con.cursor() as cursor:
             cursor.execute(
-                "SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS "
-                f"WHERE TABLE_SCHEMA='{db_config['db.db']}' AND "
-                "TABLE_NAME='history_history' AND column_name='host'"
+                "SELECT TABLE_NAME, TABLE_TYPE FROM INFORMATION_SCHEMA.TABLES "
+                "WHERE TABLE_SCHEMA=%s ORDER BY DATA_LENGTH DESC",
+                (parser.old_db,),
+            )
+            rows = cursor.fetchall()
+    tables = [r[0] for r in rows if r[1] != "VIEW"]
+    views = [r[0] for r in rows if r[1] == "VIEW"]
+    return tables, views
+
+
+def _stream_dump(
+    dump_command: List[str],
+    dump_env: Dict[str, str],
+    load_command: List[str],
+    load_env: Dict[str, str],
+    progress: Progress,
+    task: TaskID,
+) -> int:
+    """Pipe the output of a database dump into a database import.
+
+    Returns
+    -------
+    int: The number of bytes that have been transferred.
+
+    Raises
+    ------
+    CalledProcessError:
+        If the dump or the import failed.
+    """
+    logger.debug("Streaming %s into %s", shlex.join(dump_command), load_command[0])
+    # The error output goes to files, a full stderr pipe would block the
+    # clients while the dump is copied.
+    with TemporaryFile() as dump_err, TemporaryFile() as load_err:
+        dump = Popen(dump_command, stdout=PIPE, stderr=dump_err, env=dump_env)
+        load = Popen(
+            load_command, stdin=PIPE, stdout=DEVNULL, stderr=load_err, env=load_env
+        )
+        stdout, stdin = cast(IO[bytes], dump.stdout), cast(IO[bytes], load.stdin)
+        transferred, procs = 0, [(dump, dump_command, dump_err)]
+        try:
+            for chunk in iter(lambda: stdout.read(CHUNK_SIZE), b""):
+                stdin.write(chunk)
+                transferred += len(chunk)
+                progress.update(task, advance=len(chunk))
+        except BrokenPipeError:
+            # The import died, its error is reported below.
+            dump.kill()
+            dump.wait()
+            procs = []
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+        for proc, command, err in procs + [(load, load_command, load_err)]:
+            if proc.wait() != 0:
+                err.seek(0)
+                raise CalledProcessError(
+                    proc.returncode, shlex.join(command), stderr=err.read()
+                )
+    return transferred
+
+
+class Checkpoint:
+    """Progress of a chunked database migration, saved after every chunk.
+
+    Parameters
+    ----------
+    path: Path
+        The file the checkpoint is saved to.
+    source: str
+        Identifier of the old database.
+    target: str
+        Identifier of the new database.
+    resume: bool, default: False
+        Continue from an existing checkpoint of the same migration.
+    """
+
+    def __init__(
+        self, path: Path, source: str, target: str, resume: bool = False
+    ) -> None:
+        self.path = path
+        self.state: Dict[str, Any] = {"source": source, "target": target}
+        self.state["tables"] = {}
+        if not resume:
+            return
+        try:
+            state = json.loads(path.read_text())
+        except (OSError, ValueError):
+            logger.warning("No checkpoint found in %s, starting over.", path)
+            return
+        if (state.get("source"), state.get("target")) != (source, target):
+            raise ValueError(
+                f"Checkpoint {path} belongs to the migration of "
+                f"{state.get('source')} to {state.get('target')}."
             )
-            results_found = cursor.fetchall()[0][0]
-            if results_found == 0:
-                logger.info("Adding new column `host` to table.")
-                cursor.execute("ALTER TABLE history_history ADD host longtext")
+        self.state = state
+
+    @property
+    def resumed(self) -> bool:
+        """Check if a previous migration is continued."""
+        return bool(self.state["tables"])
+
+    def table(self, name: str) -> Dict[str, Any]:
+        """Get the progress of a table."""
+        return cast(
+            Dict[str, Any],
+            self.state["tables"].setdefault(
+                name, {"last": None, "offset": 0, "rows": 0, "done": False}
+            ),
+        )
+
+    def save(self) -> None:
+        """Write the checkpoint to disk."""
+        temp_file = self.path.with_suffix(".tmp")
+        temp_file.write_text(json.dumps(self.state, indent=3, default=str))
+        temp_file.replace(self.path)
+
+
+def _connect(host: str, user: str, passwd: str, port: int, db: str) -> Any:
+    """Open a database connection that handles all times as utc."""
+    con = pymysql.connect(
+        host=host, user=user, password=passwd, port=port, db=db, autocommit=False
+    )
+    with con.cursor() as cursor:
+        cursor.execute("SET time_zone='+00:00'")
+        cursor.execute("SET FOREIGN_KEY_CHECKS=0")
+    return con
+
+
+def _get_primary_key(cursor: Any, db: str, table: str) -> Optional[str]:
+    """Get the primary key of a table, None if it isn't a single column."""
+    cursor.execute(
+        "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE "
+        "WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s AND CONSTRAINT_NAME='PRIMARY'",
+        (db, table),
+    )
+    columns = [r[0] for r in cursor.fetchall()]
+    return columns[0] if len(columns) == 1 else None
+
+
+def _chunk_checksum(
+    cursor: Any, table: str, columns: List[str], where: str, args: Tuple[Any, ...]
+) -> Tuple[int, int]:
+    """Get the number of rows and a checksum of the rows of a chunk."""
+    values = ", ".join(f"`{c}`, ISNULL(`{c}`)" for c in columns)
+    cursor.execute(
+        f"SELECT COUNT(*), COALESCE(BIT_XOR(CRC32(CONCAT_WS('#', {values}))), 0) "
+        f"FROM `{table}` {where}",
+        args,
+    )
+    rows, checksum = cursor.fetchone()
+    return int(rows), int(checksum)
+
+
+def _copy_table(
+    source: Any,
+    target: Any,
+    table: str,
+    db: str,
+    chunk_size: int,
+    checkpoint: Checkpoint,
+    progress: Progress,
+) -> None:
+    """Copy a table in chunks, verify and checkpoint every chunk."""
+    state = checkpoint.table(table)
+    with source.cursor() as src, target.cursor() as dst:
+        src.execute(
+            "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
+            "WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s ORDER BY ORDINAL_POSITION",
+            (db, table),
+        )
+        columns = [r[0] for r in src.fetchall()]
+        pk = _get_primary_key(src, db, table)
+        # Remove rows that were copied after the last checkpoint was saved.
+        if pk is not None and state["last"] is not None:
+            dst.execute(f"DELETE FROM `{table}` WHERE `{pk}` > %s", (state["last"],))
+        else:
+            dst.execute(f"DELETE FROM `{table}`")
+            state.update({"offset": 0, "rows": 0})
+        target.commit()
+        src.execute(f"SELECT COUNT(*) FROM `{table}`")
+        task = progress.add_task(
+            table, total=src.fetchone()[0], completed=state["rows"]
+        )
+        col_str = ", ".join(f"`{c}`" for c in columns)
+        insert = (
+            f"INSERT INTO `{table}` ({col_str}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+        while True:
+            if pk is not None:
+                where = f"WHERE `{pk}` > %s" if state["last"] is not None else ""
+                args: Tuple[Any, ...] = (
+                    (state["last"],) if state["last"] is not None else ()
+                )
+                src.execute(
+                    f"SELECT {col_str} FROM `{table}` {where} "
+                    f"ORDER BY `{pk}` LIMIT {chunk_size}",
+                    args,
+                )
+            else:
+                src.execute(
+                    f"SELECT {col_str} FROM `{table}` ORDER BY {col_str} "
+                    f"LIMIT {chunk_size} OFFSET {state['offset']}"
+                )
+            rows = src.fetchall()
+            source.commit()
+            if not rows:
+                break
+            dst.executemany(insert, rows)
+            if pk is not None:
+                first, last = rows[0][columns.index(pk)], rows[-1][columns.index(pk)]
+                where = f"WHERE `{pk}` BETWEEN %s AND %s"
+                args = (first, last)
+                key_range = f"{pk} {first} to {last}"
+                expected = _chunk_checksum(src, table, columns, where, args)
+                copied = _chunk_checksum(dst, table, columns, where, args)
+            else:
+                # Without a primary key only the row count can be compared.
+                dst.execute(f"SELECT COUNT(*) FROM `{table}`")
+                expected = (state["offset"] + len(rows), 0)
+                copied = (int(dst.fetchone()[0]), 0)
+                key_range = (
+                    f"rows {state['offset'] + 1} to {state['offset'] + len(rows)}"
+                )
+            source.commit()
+            if expected != copied:
+                target.rollback()
+                logger.error(
+                    "Verification of table %s failed for %s: expected %i rows "
+                    "(checksum %i), got %i rows (checksum %i).",
+                    table,
+                    key_range,
+                    *expected,
+                    *copied,
+                )
+                logger.error(
+                    "Progress up to the last verified chunk is saved in %s, "
+                    "continue the migration with --resume.",
+                    checkpoint.path,
+                )
+                raise DeploymentError(
+                    f"Could not verify the migration of table {table} ({key_range})."
+                )
+            target.commit()
+            if pk is not None:
+                state["last"] = last
+            state["offset"] += len(rows)
+            state["rows"] += len(rows)
+            checkpoint.save()
+            progress.update(task, advance=len(rows))
+        state["done"] = True
+        checkpoint.save()
+
+
+def _copy_routines(
+    parser: argparse.Namespace,
+    new_db_cfg: dict[str, str],
+    progress: Progress,
+) -> None:
+    """Copy the triggers, procedures and functions of the old database."""
+    mysqldump = shutil.which("mariadb-dump")
+    mariadb = shutil.which("mariadb")
+    if mysqldump is None or mariadb is None:
+        logger.warning(
+            "mariadb-dump or mariadb not found, triggers and routines of the "
+            "old database have not been migrated."
+        )
+        return
+    dump_command = [
+        mysqldump,
+        "--ssl=0",
+        "-u",
+        parser.old_user,
+        "-h",
+        parser.old_hostname,
+        f"-P{parser.old_port}",
+        "--no-create-db",
+        "--no-create-info",
+        "--no-data",
+        "--routines",
+        "--triggers",
+        parser.old_db,
+    ]
+    load_command = [
+        mariadb,
+        "--ssl=0",
+        "-h",
+        new_db_cfg["db.host"],
+        "-u",
+        new_db_cfg["db.user"],
+        f"-P{new_db_cfg['db.port']}",
+        new_db_cfg["db.db"],
+    ]
+    dump_env = os.environ.copy()
+    dump_env["MYSQL_PWD"] = parser.old_pw or ""
+    load_env = os.environ.copy()
+    load_env["MYSQL_PWD"] = new_db_cfg["db.passwd"]
+    task = progress.add_task("triggers and routines", total=None)
+    try:
+        _stream_dump(dump_command, dump_env, load_command, load_env, progress, task)
+    except CalledProcessError as error:
+        logger.error("Command failed: %s", error.cmd)
+        logger.error("STDERROR:\n%s", error.stderr.decode())
+        raise DeploymentError("Could not migrate the triggers and routines.")
+    progress.update(task, total=1, completed=1)
+
+
+def _migrate_db_chunked(
+    parser: argparse.Namespace, new_db_cfg: dict[str, str]
+) -> None:
+    """Copy the old database in checkpointed chunks via pymysql."""
+    source_id = f"{parser.old_hostname}:{parser.old_port}/{parser.old_db}"
+    target_id = "{}:{}/{}".format(
+        new_db_cfg["db.host"], new_db_cfg["db.port"], new_db_cfg["db.db"]
+    )
+    try:
+        checkpoint = Checkpoint(parser.checkpoint, source_id, target_id, parser.resume)
+    except ValueError as error:
+        logger.error(
+            "%s Use another --checkpoint file or start over without --resume.",
+            error,
+        )
+        raise SystemExit(1)
+    tables, views = _get_tables(parser)
+    source = _connect(
+        parser.old_hostname,
+        parser.old_user,
+        parser.old_pw or "",
+        parser.old_port,
+        parser.old_db,
+    )
+    target = _connect(
+        new_db_cfg["db.host"],
+        new_db_cfg["db.user"],
+        new_db_cfg["db.passwd"],
+        int(new_db_cfg["db.port"]),
+        new_db_cfg["db.db"],
+    )
+    progress = Progress(
+        TextColumn("[bold blue]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TimeElapsedColumn(),
+        console=RichConsole,
+    )
+    with source, target, progress:
+        with source.cursor() as src, target.cursor() as dst:
+            for table in tables:
+                if checkpoint.resumed and table in checkpoint.state["tables"]:
+                    continue
+                src.execute(f"SHOW CREATE TABLE `{table}`")
+                dst.execute(f"DROP TABLE IF EXISTS `{table}`")
+                dst.execute(src.fetchone()[1])
+        for table in tables:
+            if not checkpoint.table(table)["done"]:
+                _copy_table(
+                    source,
+                    target,
+                    table,
+                    parser.old_db,
+                    parser.chunk_size,
+                    checkpoint,
+                    progress,
+                )
+        with source.cursor() as src, target.cursor() as dst:
+            for view in views:
+                src.execute(f"SHOW CREATE VIEW `{view}`")
+                create = re.sub(r"DEFINER=\S+\s", "", src.fetchone()[1])
+                dst.execute(f"DROP VIEW IF EXISTS `{view}`")
+                dst.execute(create)
+        target.commit()
+        # Triggers are created last, they mustn't fire while copying rows.
+        _copy_routines(parser, new_db_cfg, progress)
+    _add_new_db(new_db_cfg)
+    parser.checkpoint.unlink(missing_ok=True)
+    logger.info("Database has been migrated.")
 
 
 def _migrate_db(parser: argparse.Namespace) -> None:
     db_host = parser.new_hostname
+    if parser.chunk_size or parser.resume:
+        parser.chunk_size = parser.chunk_size or 10_000
+        try:
+            _migrate_db_chunked(parser, read_db_credentials(db_host))
+        except DeploymentError:
+            raise SystemExit(1)
+        return
     mysqldump = shutil.which("mariadb-dump")
-    if mysqldump is None:
-        logger.error("mariadb-dump not found, to continue install mariadb-dump")
+    mariadb = shutil.which("mariadb")
+    if mysqldump is None or mariadb is None:
+        logger.error(
+            "mariadb-dump or mariadb not found, to continue install the "
+            "mariadb client"
+        )
         return
     new_db_cfg = read_db_credentials(db_host)
-    with NamedTemporaryFile(suffix=".sql") as temp_file:
-        with open(temp_file.name, "w") as f_obj:
-            f_obj.write(f"USE `{new_db_cfg['db.db']}`;\n")
-            f_obj.flush()
-            dump_command = (
-                f"{mysqldump} --ssl=0 -u {parser.old_user} "
-                f"-h {parser.old_hostname} -p'{parser.old_pw}' "
-                f"-P{parser.old_port} "
-                "--tz-utc --no-create-db "
-                f"{parser.old_db}"
+    compress = ["--compress"] if parser.compress else []
+    dump_command = [
+        mysqldump,
+        "--ssl=0",
+        "-u",
+        parser.old_user,
+        "-h",
+        parser.old_hostname,
+        f"-P{parser.old_port}",
+        "--tz-utc",
+        "--no-create-db",
+    ] + compress
+    load_command = [
+        mariadb,
+        "--ssl=0",
+        "-h",
+        new_db_cfg["db.host"],
+        "-u",
+        new_db_cfg["db.user"],
+        f"-P{new_db_cfg['db.port']}",
+    ] + compress
+    dump_env = os.environ.copy()
+    dump_env["MYSQL_PWD"] = parser.old_pw or ""
+    load_env = os.environ.copy()
+    load_env["MYSQL_PWD"] = new_db_cfg["db.passwd"]
+    if parser.jobs > 1:
+        tables, views = _get_tables(parser)
+        batches = [[t] for t in tables]
+    else:
+        batches, views = [[]], []
+    progress = Progress(
+        TextColumn("[bold blue]{task.description}"),
+        DownloadColumn(),
+        TransferSpeedColumn(),
+        TimeElapsedColumn(),
+        console=RichConsole,
+    )
+
+    def migrate(objects: List[str]) -> int:
+        task = progress.add_task(", ".join(objects) or parser.old_db, total=None)
+        command = dump_command + [parser.old_db] + objects
+        load = load_command + [new_db_cfg["db.db"]]
+        try:
+            transferred = _stream_dump(
+                command, dump_env, load, load_env, progress, task
             )
-            try:
-                exec_command(dump_command, stdout=f_obj)
-            except CalledProcessError as error:
-                if "Unknown table \\'COLUMN_STATISTICS\\'" in str(error.stderr):
-                    dump_command = dump_command + " --column-statistics=0 "
-                    exec_command(dump_command, stdout=f_obj)
-                else:
-                    raise error
-            _add_new_db(new_db_cfg, temp_file.name)
+        except CalledProcessError as error:
+            if "COLUMN_STATISTICS" not in str(error.stderr):
+                logger.error("Command failed: %s", error.cmd)
+                logger.error("STDERROR:\n%s", error.stderr.decode())
+                raise error
+            command.insert(1, "--column-statistics=0")
+            progress.reset(task)
+            transferred = _stream_dump(
+                command, dump_env, load, load_env, progress, task
+            )
+        progress.update(task, total=transferred, completed=transferred)
+        return transferred
+
+    start = time.monotonic()
+    with progress:
+        # Views are migrated last, they need the tables.
+        with ThreadPoolExecutor(max_workers=max(parser.jobs, 1)) as pool:
+            transferred = sum(pool.map(migrate, batches))
+        if views:
+            transferred += migrate(views)
+    duration = time.monotonic() - start
+    logger.info(
+        "Migrated %.1f MB in %.1fs (%.1f MB/s)",
+        transferred / 1024**2,
+        duration,
+        transferred / 1024**2 / max(duration, 1e-6),
+    )
+    _add_new_db(new_db_cfg)
 
 
 def _migrate_drs(parser: argparse.Namespace) -> None:
@@ -223,6 +680,49 @@ def create_parser(
         default="evaluationsystem",
         help="The old database user",
     )
+    db_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help=(
+            "Migrate this many tables at the same time. By default the whole "
+            "database is migrated in one stream."
+        ),
+    )
+    db_parser.add_argument(
+        "--compress",
+        action="store_true",
+        default=False,
+        help=(
+            "Compress the traffic between the database servers and this host "
+            "with the (zlib) protocol compression of the mariadb clients. "
+            "The dump is piped into the import on this host, hence there is "
+            "no separate zstd or gzip compression of the stream."
+        ),
+    )
+    db_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=0,
+        help=(
+            "Copy the tables in chunks of this many rows. Every chunk is "
+            "verified and its progress saved, to allow resuming an "
+            "interrupted migration."
+        ),
+    )
+    db_parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Resume an interrupted chunked migration from its checkpoint.",
+    )
+    db_parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        default=Path("freva-db-migration.json"),
+        help="File where the progress of a chunked migration is saved.",
+    )
     db_parser.set_defaults(cli=_migrate_db)
     return parser
 
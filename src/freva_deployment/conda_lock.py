@@ -0,0 +1,194 @@
+"""Explicit conda lock files that are solved once on the control node."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import appdirs
+import yaml
+
+from .logger import logger
+from .utils import asset_dir
+
+try:
+    import jinja2
+
+    _JINJA = True
+except ImportError:  # pragma: no cover
+    _JINJA = False
+
+LOCK_DIR = Path(appdirs.user_cache_dir()) / "freva" / "deployment" / "locks"
+"""Directory where the solved lock files are kept."""
+
+LOCK_TTL = float(os.getenv("FREVA_DEPLOYMENT_LOCK_TTL", str(7 * 86400)))
+"""Seconds after which the packages of a lock file are solved again."""
+
+CHANNEL = "conda-forge"
+
+ROLE_PACKAGES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "core": ("conda_pkgs", ()),
+    "cache": ("conda_packages", ("git", "curl")),
+    "database": ("conda_packages", ("git", "curl")),
+    "freva-rest": ("conda_packages", ("git", "curl")),
+    "mongodb_server": ("conda_packages", ("git", "curl")),
+    "search_server": ("conda_packages", ("git", "curl")),
+    "vault": ("conda_packages", ("git", "curl")),
+    "web": ("conda_packages", ("git", "curl")),
+}
+"""The variable holding the conda packages of a role and additional packages
+that are always installed."""
+
+LockIndex = Dict[str, Dict[str, Dict[str, str]]]
+
+
+def _get_packages(role: str, variables: Dict[str, Any]) -> List[str]:
+    """Get the rendered conda packages of a role."""
+    key, extra = ROLE_PACKAGES[role]
+    role_vars = yaml.safe_load(
+        (asset_dir / "playbooks" / "roles" / role / "files" / "vars.yml").read_text()
+    )
+    env = jinja2.Environment(undefined=jinja2.StrictUndefined)
+    packages = list(extra)
+    for package in role_vars.get(key) or []:
+        package = env.from_string(str(package)).render(**variables)
+        packages.append(package.replace("'", "").replace('"', "").strip())
+    return packages
+
+
+def create_lockfile(packages: Iterable[str], platform: str, micromamba: str) -> Path:
+    """Solve a list of packages and save the result as explicit lock file.
+
+    Lock files are re-used for ``LOCK_TTL`` seconds.
+
+    Parameters
+    ----------
+    packages: list[str]
+        The package specs that are installed.
+    platform: str
+        The conda platform of the target, e.g. linux-64.
+    micromamba: str
+        Path to the micromamba executable.
+
+    Returns
+    -------
+    Path: The path to the lock file.
+    """
+    packages = sorted(set(packages))
+    key = hashlib.sha256(
+        json.dumps([platform, CHANNEL, packages]).encode("utf-8")
+    ).hexdigest()
+    lock_file = LOCK_DIR / f"{key}.txt"
+    if lock_file.is_file() and time.time() - lock_file.stat().st_mtime < LOCK_TTL:
+        return lock_file
+    logger.debug("Solving %s for %s", " ".join(packages), platform)
+    with TemporaryDirectory() as temp_dir:
+        res = subprocess.run(
+            [
+                micromamba,
+                "create",
+                "-p",
+                str(Path(temp_dir) / "env"),
+                "--dry-run",
+                "--json",
+                "-y",
+                "--platform",
+                platform,
+                "-c",
+                CHANNEL,
+                "--override-channels",
+                *packages,
+            ],
+            capture_output=True,
+            text=True,
+            env={**os.environ, "MAMBA_ROOT_PREFIX": temp_dir},
+        )
+    if res.returncode != 0:
+        raise ValueError(res.stderr.strip() or res.stdout.strip())
+    links = json.loads(res.stdout).get("actions", {}).get("LINK", [])
+    lines = [
+        f"# platform: {platform}",
+        f"# packages: {' '.join(packages)}",
+        "@EXPLICIT",
+    ]
+    lines += sorted(f"{p['url']}#{p['md5']}" for p in links)
+    LOCK_DIR.mkdir(exist_ok=True, parents=True)
+    temp_file = lock_file.with_suffix(".tmp")
+    temp_file.write_text("\n".join(lines) + "\n")
+    temp_file.replace(lock_file)
+    return lock_file
+
+
+def lock_environments(
+    roles: Dict[str, Dict[str, Any]],
+    platforms: Iterable[str],
+    micromamba: Optional[str] = None,
+) -> LockIndex:
+    """Create the lock files of the conda environments of a couple of roles.
+
+    Parameters
+    ----------
+    roles: dict[str, dict]
+        The roles and the variables their packages are rendered with.
+    platforms: list[str]
+        The conda platforms lock files are created for.
+    micromamba: str, default: None
+        Path to the micromamba executable, defaults to the one in PATH.
+
+    Returns
+    -------
+    dict: The lock file and its sha256 by role and platform. Roles whose
+          packages can't be solved are missing.
+    """
+    micromamba = micromamba or shutil.which("micromamba") or os.getenv("MAMBA_EXE")
+    if not micromamba or not _JINJA:
+        logger.warning(
+            "Can't lock the conda environments, %s isn't installed. The "
+            "environments are solved on the hosts instead, set "
+            "FREVA_DEPLOYMENT_CONDA_LOCK=0 to silence this warning.",
+            "micromamba" if not micromamba else "jinja2",
+        )
+        return {}
+    jobs: Dict[Tuple[str, str], List[str]] = {}
+    for role, variables in roles.items():
+        if role not in ROLE_PACKAGES:
+            continue
+        try:
+            packages = _get_packages(role, variables)
+        except (OSError, jinja2.TemplateError) as error:
+            logger.debug("Can't lock the packages of %s: %s", role, error)
+            continue
+        for platform in platforms:
+            jobs[(role, platform)] = packages
+    index: LockIndex = {}
+    if not jobs:
+        return index
+    with ThreadPoolExecutor(max_workers=min(len(jobs), 4)) as pool:
+        futures = {
+            job: pool.submit(create_lockfile, packages, job[1], micromamba)
+            for job, packages in jobs.items()
+        }
+    for (role, platform), future in futures.items():
+        try:
+            lock_file = future.result()
+        except (ValueError, OSError) as error:
+            logger.warning(
+                "Could not lock the %s environment for %s: %s",
+                role,
+                platform,
+                error,
+            )
+            continue
+        index.setdefault(role, {})[platform] = {
+            "file": str(lock_file),
+            "hash": hashlib.sha256(lock_file.read_bytes()).hexdigest(),
+        }
+    return index
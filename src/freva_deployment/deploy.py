@@ -17,7 +17,7 @@ from copy import deepcopy
 from getpass import getuser
 from pathlib import Path
 from socket import gethostbyname, gethostname
-from typing import Any, Dict, Optional, Union, cast
+from typing import Any, Dict, Iterable, Optional, Union, cast
 from urllib.parse import urlparse
 from urllib.request import urlretrieve
 
@@ -26,7 +26,7 @@ import petname
 import tomlkit
 import yaml
 from rich import print as pprint
-from rich.prompt import Prompt
+from rich.prompt import Confirm, Prompt
 from typing_extensions import NotRequired, TypedDict
 
 import freva_deployment.callback_plugins
@@ -35,17 +35,21 @@ from freva_deployment import AUX_URL, FREVA_PYTHON_VERSION, __version__
 from .error import ConfigurationError, handled_exception
 from .keys import RandomKeys
 from .logger import logger
-from .runner import RunnerDir
+from .playbook_index import get_playbook_variables
+from .profiler import DeploymentProfiler
+from .runner import RunnerDir, TaskResultEvent
+from .scheduler import PlayScheduler
+from .state import DeploymentState, hash_step
 from .utils import (
     RichConsole,
     asset_dir,
     config_dir,
     get_cache_information,
     get_passwd,
-    load_config,
-    merge_toml_documents,
+    is_interactive,
+    load_inventory,
 )
-from .versions import get_steps_from_versions, get_versions
+from .versions import VersionFacts, get_steps_from_versions, get_versions
 
 LOCAL_DEBUG_MSG = (
     "A freva test installation was successfully set up on your "
@@ -161,6 +165,21 @@ def mamba_to_conda_arch(arch: str) -> str:
     return translate.get(arch, "linux-64")
 
 
+def conda_to_mamba_arch(arch: str) -> str:
+    """Translate a conda to a mamba arch."""
+    translate = {
+        "Linux-x86_64": "linux-64",
+        "Linux-aarch64": "linux-aarch64",
+        "Linux-ppc64le": "linux-ppc64le",
+        "Linux-s390x": "linux-s390x",
+        "MacOSX-x86_64": "osx-64",
+        "MacOSX-arm64": "osx-arm64",
+    }
+    if arch in translate.values():
+        return arch
+    return translate.get(arch, "linux-64")
+
+
 class DeployFactory:
     """Apply freva deployment and its services.
 
@@ -214,6 +233,8 @@ class DeployFactory:
         self.eval_conf_file: Path = self._td.parent_dir / "evaluation_system.conf"
         self.web_conf_file: Path = self._td.parent_dir / "freva_web.toml"
         self._db_pass: str = ""
+        self.step_hashes: dict[str, str] = {}
+        self.gate_time: float = 0.0
         self._steps = steps or ["db", "freva_rest", "web", "core"]
         if self._steps in (["auto"], "auto"):
             self._steps = []
@@ -523,6 +544,9 @@ class DeployFactory:
         self.cfg["core"]["scheduler_output_dir"] = str(scheduler_output_dir)
         self.cfg["core"]["keyfile"] = self.public_key_file
         self.cfg["core"]["git_url"] = "https://github.com/FREVA-CLINT/freva.git"
+        self.cfg["core"]["git_ref"] = (
+            str(self.cfg["core"].get("git_ref") or "").strip() or "HEAD"
+        )
 
     def _prep_web(self, ask_pass: bool = True) -> None:
         """prepare the web deployment."""
@@ -731,13 +755,7 @@ class DeployFactory:
             "search_server": "freva_rest",
         }
         try:
-            if self._secrets_file:
-                secrets = tomlkit.loads(Path(self._secrets_file).read_text())
-            else:
-                secrets = None
-            config: Dict[str, Any] = dict(
-                merge_toml_documents(load_config(self._inv_tmpl, convert=True), secrets)
-            )
+            config = load_inventory(self._inv_tmpl, self._secrets_file)
             self._master_pass = cast(str, config.pop("master_password", ""))
             for dest, source in mapper.items():
                 host = (
@@ -872,7 +890,6 @@ class DeployFactory:
                 "The following, [b]not selected[/b] steps will be auto "
                 f"updated.\n[green]{', '.join(additional_steps)}[/]"
             )
-            time.sleep(3)
         new_steps = set(steps + self.steps)
         if not new_steps:
             return None
@@ -904,13 +921,7 @@ class DeployFactory:
                 config["kubernetes"]["vars"]["ansible_user"]
             ]
 
-        playbooks = "\n".join(
-            [
-                a.read_text()
-                for a in (asset_dir / "playbooks").rglob("*.*")
-                if a.is_file()
-            ]
-        )
+        playbook_variables = get_playbook_variables()
         main_playbook = yaml.safe_load(
             (asset_dir / "playbooks" / "main-deployment.yml").read_text()
         )
@@ -941,7 +952,7 @@ class DeployFactory:
                     new_key = key
                 else:
                     new_key = f"{step.replace('-', '_')}_{key}"
-                if new_key in playbooks:
+                if new_key in playbook_variables:
                     config[step]["vars"][new_key] = value
             config[step]["vars"]["project_name"] = self.project_name
             config[step]["vars"][f"{step}_admin_user"] = self.cfg[step].get(
@@ -1001,6 +1012,26 @@ class DeployFactory:
         core_host: Optional[str] = config.get("core", {}).get("hosts")
         if core_host in hosts:
             config["core"]["hosts"] = gethostbyname(core_host) or ""
+        # Generated certificates are different on every run.
+        volatile: list[str] = []
+        certs = self.cfg.get("certificates", {})
+        if self.gen_keys and not (
+            certs.get("public_keyfile") or certs.get("chain_keyfile")
+        ):
+            volatile.append("web_cert_content")
+        if self.gen_keys and not certs.get("private_keyfile"):
+            volatile.append("web_key_content")
+        self.step_hashes = {
+            step: hash_step(
+                step,
+                cast(Dict[str, Any], config),
+                main_playbook,
+                versions,
+                ignore=(str(self._td.parent_dir), self._random_key.key_dir),
+                volatile=volatile,
+            )
+            for step in self.steps
+        }
         return yaml.dump(json.loads(json.dumps(config)))
 
     @property
@@ -1105,6 +1136,10 @@ class DeployFactory:
         tags: Optional[list[str]] = None,
         local: bool = False,
         extra: Optional[Dict[str, str]] = None,
+        max_workers: int = 1,
+        profile: Optional[Path] = None,
+        force: bool = False,
+        image_mirror: bool = False,
     ) -> None:
         """Play the ansible playbook.
 
@@ -1126,6 +1161,20 @@ class DeployFactory:
             Use local connections only.
         extra:
             Add/Override inventory settings.
+        max_workers: int, default: 1
+            Maximum number of services that are deployed at the same time.
+            Services are only deployed simultaneously if they don't depend
+            on each other and don't share any hosts.
+        profile: Path, default: None
+            Record the time spent in each task, role, play and host, display
+            a summary and save the timings in collapsed stack format to this
+            file.
+        force: bool, default: False
+            Deploy all selected steps, even if their configuration, roles and
+            versions haven't changed since their last successful deployment.
+        image_mirror: bool, default: False
+            Pull the container images once on this machine and copy them to
+            the hosts instead of pulling them on every host.
 
         """
         try:
@@ -1136,6 +1185,10 @@ class DeployFactory:
                 skip_version_check=skip_version_check,
                 tags=tags,
                 extra=extra,
+                max_workers=max_workers,
+                profile=profile,
+                force=force,
+                image_mirror=image_mirror,
             )
         except KeyboardInterrupt as error:
             if str(error):
@@ -1171,14 +1224,22 @@ class DeployFactory:
             steps = [s for s in steps if s != "web"]
         steps.append("vault")
         version_path = self._td.parent_dir / "versions.txt"
+        facts = VersionFacts(
+            self.project_name, self.cfg.get("deployment_method", "docker")
+        )
+        detected_versions: dict[str, str] = {}
         hosts = []
         for tasks in playbook_tmpl:
             step = tasks["hosts"]
             if step == "core":
                 continue
             if step in steps:
-                playbook.append(tasks)
                 host_var = cfg[step][f"{step}_host"]
+                cached_version = facts.get(host_var, step)
+                if cached_version is not None:
+                    detected_versions[step] = cached_version
+                    continue
+                playbook.append(tasks)
                 hosts.append(host_var)
                 config[step] = {}
                 config[step]["hosts"] = host_var
@@ -1201,27 +1262,135 @@ class DeployFactory:
                     f"{step.replace('-', '_')}_version": versions[step],
                 }
                 self._set_python_interpreter(step, config)
-        result = self._td.run_ansible_playbook(
-            playbook=playbook,
-            inventory=config,
-            envvars=envvars,
-            passwords=passwords,
-            extravars=extravars,
-            verbosity=verbosity,
-            hide_output=True,
-            text="Getting versions of micro-services ...",
-        )
-        versions = {}
-        for line in result.splitlines():
-            jline = json.loads(line)
-            if "msg" in jline["result"] and jline["task"].lower().startswith("display"):
-                service = jline["task"].split()[1].lower()
-                version = jline["result"]["msg"].strip()
-                versions[service.strip()] = version.strip()
-        logger.debug("Detected versions: %s", versions)
-        additional_steps = get_steps_from_versions(versions)
+        events: Iterable[TaskResultEvent] = []
+        if playbook:
+            events = self._td.iter_ansible_playbook(
+                playbook=playbook,
+                inventory=config,
+                envvars=envvars,
+                passwords=passwords,
+                extravars=extravars,
+                verbosity=verbosity,
+                hide_output=True,
+                text="Getting versions of micro-services ...",
+            )
+        else:
+            logger.info("Using cached versions of micro-services.")
+        for event in events:
+            result = event.get("result", {})
+            task = event.get("task", "")
+            if (
+                event["event"] == "runner_on_ok"
+                and "msg" in result
+                and task.lower().startswith("display")
+            ):
+                service = task.split()[1].lower().strip()
+                version = result["msg"].strip()
+                detected_versions[service] = version
+                if service in config:
+                    facts.set(config[service]["hosts"], service, version)
+        facts.save()
+        logger.debug("Detected versions: %s", detected_versions)
+        additional_steps = get_steps_from_versions(detected_versions)
         return additional_steps
 
+    def _mirror_images(self, tags: list[str]) -> str:
+        """Fetch the images of the deployed steps into the image mirror.
+
+        Returns
+        -------
+        str: Path to the index of the mirrored images of this deployment.
+        """
+        from .image_mirror import ImageMirror, get_images
+
+        images = get_images(tags, get_versions())
+        with RichConsole.status(
+            f"Mirroring {len(images)} container images ..."
+        ):
+            entries = ImageMirror().sync(images)
+        size = sum(int(e["size"]) for e in entries.values())
+        logger.info(
+            "Mirrored %i images (%.1f MB)", len(entries), size / 1024**2
+        )
+        index_file = self._td.parent_dir / "image-mirror.json"
+        index_file.write_text(json.dumps(entries))
+        return str(index_file)
+
+    def _lock_conda_environments(self, tags: list[str], inventory: str) -> str:
+        """Solve the conda environments of the deployed roles on this machine.
+
+        Returns
+        -------
+        str: Path to the index of the lock files, empty if nothing was locked.
+        """
+        from .conda_lock import lock_environments
+
+        config = yaml.safe_load(inventory) or {}
+        plays = yaml.safe_load(
+            (asset_dir / "playbooks" / "main-deployment.yml").read_text()
+        )
+        roles: dict[str, dict[str, Any]] = {}
+        for play in plays:
+            group = play.get("hosts", "")
+            if group not in config or not set(play.get("tags", [])) & set(tags):
+                continue
+            # Only the core is installed with conda for every deployment method.
+            if group != "core" and self.cfg.get("deployment_method") != "conda":
+                continue
+            for role in play.get("roles") or []:
+                roles[role] = config[group].get("vars", {})
+        if not roles:
+            return ""
+        platforms = {"linux-64", get_current_architecture()}
+        if "core" in config:
+            platforms.add(conda_to_mamba_arch(self.cfg["core"].get("arch", "")))
+        platforms = {p for p in platforms if p.startswith("linux-")}
+        with RichConsole.status("Locking conda environments ..."):
+            index = lock_environments(roles, sorted(platforms))
+        if not index:
+            return ""
+        index_file = self._td.parent_dir / "conda-lock.json"
+        index_file.write_text(json.dumps(index))
+        return str(index_file)
+
+    def _update_version_facts(self, tags: list[str]) -> None:
+        """Remember the versions of the services that have been deployed."""
+        facts = VersionFacts(
+            self.project_name, self.cfg.get("deployment_method", "docker")
+        )
+        versions = get_versions()
+        deployed_by = {
+            "vault": ("db", "vault"),
+            "freva_rest": ("freva_rest", "freva-rest"),
+            "web": ("web",),
+        }
+        for service, service_tags in deployed_by.items():
+            host = self.cfg.get(service, {}).get(f"{service}_host")
+            if host and set(service_tags) & set(tags):
+                facts.set(host, service, versions[service])
+        facts.save()
+
+    def confirm(self, question: str) -> None:
+        """Ask the user to confirm the next deployment step.
+
+        Nothing is asked if the deployment isn't interactive, the time spent
+        waiting for the answer is added to :py:attr:`gate_time`.
+
+        Raises
+        ------
+        KeyboardInterrupt:
+            If the user doesn't confirm.
+        """
+        if not is_interactive():
+            return
+        start = time.monotonic()
+        try:
+            answer = Confirm.ask(f"[green]{question}[/green]", default=True)
+        finally:
+            self.gate_time += time.monotonic() - start
+        if not answer:
+            raise KeyboardInterrupt("Deployment aborted.")
+
     def inspect(
         self, extra: Optional[Dict[str, str]] = None, tags: Optional[list[str]] = None
     ) -> None:
@@ -1245,8 +1414,15 @@ class DeployFactory:
         tags: Optional[list[str]] = None,
         local: bool = False,
         extra: Optional[Dict[str, str]] = None,
+        max_workers: int = 1,
+        profile: Optional[Path] = None,
+        force: bool = False,
+        image_mirror: bool = False,
     ) -> None:
+        start = time.monotonic()
+        self.gate_time = 0.0
         extra = extra or {}
+        incremental = not (force or tags)
         plugin_path = Path(freva_deployment.callback_plugins.__file__).parent
         envvars: dict[str, str] = {
             "ANSIBLE_CONFIG": str(self._td.ansible_config_file),
@@ -1281,25 +1457,25 @@ class DeployFactory:
         extravars: dict[str, str] = {
             "ansible_port": str(ssh_port),
             "ansible_config": str(self._td.ansible_config_file),
-            "ansible_ssh_args": "-o ForwardX11=no -o StrictHostKeyChecking=no",
+            "ansible_ssh_args": (
+                "-o ForwardX11=no -o StrictHostKeyChecking=no "
+                f"{self._td.ssh_control_args}"
+            ),
         }
 
         self.passwords = self.get_ansible_password(ask_pass)
         self._set_deployment_methods()
         local_connection = local or self.local_debug
         steps = [s for s in self.steps]
+        outdated_steps: list[str] = []
         if skip_version_check is False:
-            steps = list(
-                set(
-                    steps
-                    + self.get_steps_from_versions(
-                        envvars.copy(),
-                        extravars.copy(),
-                        self.passwords.copy(),
-                        verbosity,
-                    )
-                )
+            outdated_steps = self.get_steps_from_versions(
+                envvars.copy(),
+                extravars.copy(),
+                self.passwords.copy(),
+                verbosity,
             )
+            steps = list(set(steps + outdated_steps))
         tags = [t for t in tags or steps]
         ask_master_pass = False
         for t in tags:
@@ -1313,6 +1489,24 @@ class DeployFactory:
         if inventory is None:
             logger.info("Services up to date, nothing to do!")
             return None
+        state = DeploymentState(self.project_name)
+        if incremental:
+            unchanged = [
+                t
+                for t in tags
+                if t not in outdated_steps
+                and t in self.step_hashes
+                and state.get(t) == self.step_hashes[t]
+            ]
+            if unchanged:
+                logger.info(
+                    "Skipping unchanged steps: %s, use --force to deploy them.",
+                    ", ".join(unchanged),
+                )
+            tags = [t for t in tags if t not in unchanged]
+            if not tags:
+                logger.info("Services up to date, nothing to do!")
+                return None
         if self.local_debug:
             logger.info("Overriding configuration for local deployment!")
         logger.debug(inventory)
@@ -1320,19 +1514,66 @@ class DeployFactory:
         RichConsole.rule(
             f"[r]Playing tasks: [i]{', '.join(tags or steps)}[/] with ansible[/]"
         )
-        time.sleep(3)
-        config.pop("stdout_callback")
-        config.pop("callback_plugins")
+        self.confirm("Start the deployment?")
+        if image_mirror and self.cfg.get("deployment_method", "docker") in (
+            "docker",
+            "podman",
+        ):
+            extravars["image_mirror_index"] = self._mirror_images(tags)
+        if os.getenv("FREVA_DEPLOYMENT_CONDA_LOCK", "1") != "0":
+            conda_lock_index = self._lock_conda_environments(tags, inventory)
+            if conda_lock_index:
+                extravars["conda_lock_index"] = conda_lock_index
+        profiler = DeploymentProfiler() if profile else None
+        if profiler is None:
+            config.pop("stdout_callback")
+            config.pop("callback_plugins")
         self._td.create_config(**config)
-        self._td.run_ansible_playbook(
-            working_dir=asset_dir,
-            playbook=asset_dir / "playbooks" / "main-deployment.yml",
-            inventory=inventory,
-            envvars=envvars,
-            tags=list(set(tags)),
-            passwords=self.passwords,
-            extravars=extravars,
-            verbosity=verbosity,
+        main_playbook = asset_dir / "playbooks" / "main-deployment.yml"
+
+        def play_playbook(playbook: Path, name: str, capture_output: bool) -> None:
+            for event in self._td.iter_ansible_playbook(
+                working_dir=asset_dir,
+                playbook=playbook,
+                inventory=inventory,
+                envvars=envvars.copy(),
+                tags=list(set(tags)),
+                passwords=self.passwords,
+                extravars=extravars.copy(),
+                verbosity=verbosity,
+                capture_output=capture_output,
+                text=name,
+            ):
+                if profiler is not None:
+                    profiler.add(event)
+
+        try:
+            if max_workers > 1:
+                scheduler = PlayScheduler(
+                    main_playbook,
+                    inventory,
+                    tags=list(set(tags)),
+                    max_workers=max_workers,
+                )
+                scheduler.run(
+                    lambda playbook, name: play_playbook(playbook, name, True),
+                    self._td.project_dir / "playbooks",
+                )
+            else:
+                play_playbook(main_playbook, "Running playbook ...", False)
+        finally:
+            if profiler is not None and profile is not None:
+                profiler.print_summary()
+                profiler.write_collapsed(profile)
+        self._update_version_facts(tags)
+        for tag in tags:
+            if tag in self.step_hashes:
+                state.set(tag, self.step_hashes[tag])
+        state.save()
+        logger.info(
+            "Deployment finished after %.1fs (%.1fs waiting for confirmation).",
+            time.monotonic() - start,
+            self.gate_time,
         )
         if self.local_debug:
             RichConsole.rule("[b red]:bulb:   NOTE:[/]")
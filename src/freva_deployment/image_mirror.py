@@ -0,0 +1,171 @@
+"""Mirror the container images of a deployment on the control node."""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import appdirs
+
+from .error import ConfigurationError
+from .logger import logger
+from .versions import _is_offline
+
+REGISTRY = "ghcr.io/freva-org"
+"""The registry the freva images are pulled from."""
+
+IMAGE_STORE = Path(
+    os.getenv(
+        "FREVA_DEPLOYMENT_IMAGE_STORE",
+        Path(appdirs.user_cache_dir()) / "freva" / "deployment" / "images",
+    )
+)
+"""Directory where the image archives are kept."""
+
+STEP_IMAGES: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "db": (("freva-mysql", "db"), ("freva-vault", "vault")),
+    "freva_rest": (
+        ("freva-rest-api", "freva_rest"),
+        ("freva-redis", "redis"),
+        ("freva-mongo", "mongodb_server"),
+        ("freva-solr", "solr"),
+    ),
+    "web": (("freva-web", "web"), ("freva-nginx", "nginx")),
+}
+"""The images and the names of their versions that each step deploys."""
+
+ImageEntry = Dict[str, Union[str, int]]
+
+
+def get_images(steps: Iterable[str], versions: Dict[str, str]) -> List[str]:
+    """Get the images that are needed to deploy a couple of steps.
+
+    Parameters
+    ----------
+    steps: list[str]
+        The deployment steps.
+    versions: dict[str, str]
+        The versions of the services, as returned by
+        :py:func:`freva_deployment.versions.get_versions`.
+
+    Returns
+    -------
+    list[str]: The image references.
+    """
+    images = []
+    for step in steps:
+        for name, service in STEP_IMAGES.get(step, ()):
+            version = versions.get(service, "").strip()
+            if version:
+                images.append(f"{REGISTRY}/{name}:{version}")
+    return sorted(set(images))
+
+
+class ImageMirror:
+    """Content addressed store of image archives on the control node.
+
+    Images are pulled once by the local container engine, which only
+    downloads layers that changed. Every image is saved to an archive that
+    is named after the image id, archives of images that haven't changed
+    are re-used.
+
+    Parameters
+    ----------
+    store: Path, default: IMAGE_STORE
+        Directory where the archives and their index are kept.
+    engine: str, default: None
+        The container engine, defaults to podman or docker, whichever is
+        installed.
+    """
+
+    def __init__(
+        self, store: Path = IMAGE_STORE, engine: Optional[str] = None
+    ) -> None:
+        engine = engine or shutil.which("podman") or shutil.which("docker")
+        if not engine:
+            raise ConfigurationError(
+                "Mirroring images needs podman or docker on this machine."
+            )
+        self.engine = engine
+        self.store = store
+        self.index_file = store / "index.json"
+
+    def _run(self, *args: str) -> str:
+        try:
+            res = subprocess.run(
+                [self.engine, *args], capture_output=True, text=True, check=True
+            )
+        except subprocess.CalledProcessError as error:
+            raise ConfigurationError(
+                f"{' '.join(error.cmd)} failed: {error.stderr.strip()}"
+            ) from None
+        return res.stdout.strip()
+
+    def _read_index(self) -> Dict[str, ImageEntry]:
+        try:
+            return dict(json.loads(self.index_file.read_text()))
+        except (OSError, ValueError):
+            return {}
+
+    def _fetch(self, image: str) -> ImageEntry:
+        """Pull an image and save it to the store if it isn't there yet."""
+        if not _is_offline():
+            logger.debug("Pulling %s", image)
+            self._run("pull", image)
+        image_id = self._run("image", "inspect", "--format", "{{.Id}}", image)
+        digest = image_id.removeprefix("sha256:")
+        archive = self.store / "blobs" / f"{digest}.tar"
+        if not archive.is_file():
+            logger.info("Saving %s to the image mirror", image)
+            temp_file = archive.with_suffix(".tmp")
+            self._run("save", "-o", str(temp_file), image)
+            temp_file.replace(archive)
+        return {
+            "archive": str(archive),
+            "id": digest,
+            "size": archive.stat().st_size,
+        }
+
+    def sync(
+        self, images: Iterable[str], max_workers: int = 4
+    ) -> Dict[str, ImageEntry]:
+        """Make sure the archives of a couple of images are up to date.
+
+        Parameters
+        ----------
+        images: list[str]
+            The image references.
+        max_workers: int, default: 4
+            The number of images that are fetched at the same time.
+
+        Returns
+        -------
+        dict[str, dict]: The archive, image id and archive size of each image.
+        """
+        images = list(images)
+        (self.store / "blobs").mkdir(exist_ok=True, parents=True)
+        index = self._read_index()
+        entries: Dict[str, ImageEntry] = {}
+        if images:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                entries = dict(zip(images, pool.map(self._fetch, images)))
+        # Only keep the latest archive of every image.
+        repositories = {i.rpartition(":")[0] for i in entries}
+        index = {
+            i: e for i, e in index.items() if i.rpartition(":")[0] not in repositories
+        }
+        index.update(entries)
+        used = {Path(str(e["archive"])).name for e in index.values()}
+        for archive in (self.store / "blobs").glob("*.tar"):
+            if archive.name not in used:
+                logger.debug("Removing outdated image archive %s", archive)
+                archive.unlink()
+        temp_file = self.index_file.with_suffix(".tmp")
+        temp_file.write_text(json.dumps(index, indent=3))
+        temp_file.replace(self.index_file)
+        return entries
@@ -39,6 +39,11 @@ class RandomKeys:
         self._private_key: Optional["rsa.RSAPrivateKey"] = None
         self._temp_dir = TemporaryDirectory("random_keys")
 
+    @property
+    def key_dir(self) -> str:
+        """The directory the generated key files are saved to."""
+        return self._temp_dir.name
+
     @staticmethod
     def _check_crypto() -> None:
         if not _CRYPTO:
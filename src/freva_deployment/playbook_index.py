@@ -0,0 +1,169 @@
+"""Index of the variable names that are used by the deployment playbooks."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterator, Set
+
+import appdirs
+import yaml
+
+from .logger import logger
+from .utils import asset_dir
+
+try:
+    import jinja2
+    from jinja2 import nodes
+
+    _JINJA = True
+except ImportError:  # pragma: no cover
+    _JINJA = False
+
+INDEX_FILE = (
+    Path(appdirs.user_cache_dir())
+    / "freva"
+    / "deployment"
+    / "playbook-variables.json"
+)
+"""Location of the cached variable index."""
+
+INDEX_VERSION = 1
+"""Version of the index format, bump it if the extraction changes."""
+
+EXPRESSION_KEYS = (
+    "when",
+    "changed_when",
+    "failed_when",
+    "until",
+    "that",
+    "loop",
+    "with_items",
+    "with_dict",
+    "with_list",
+)
+"""Task keywords whose values are bare jinja expressions."""
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_TEMPLATE_BLOCK = re.compile(r"\{\{(.*?)\}\}|\{%(.*?)%\}", re.S)
+_YAML_KEY = re.compile(r"^[\s-]*([A-Za-z_][A-Za-z0-9_]*)\s*:", re.M)
+
+_index: Dict[str, FrozenSet[str]] = {}
+
+
+def _scan_blocks(text: str) -> Set[str]:
+    """Get all identifiers within the jinja blocks of a text."""
+    names: Set[str] = set()
+    for match in _TEMPLATE_BLOCK.finditer(text):
+        names |= set(_IDENTIFIER.findall(match.group(1) or match.group(2)))
+    return names
+
+
+def _scan_template(text: str) -> Set[str]:
+    """Get the variable names and name-like string constants of a template.
+
+    String constants are added because variables are also looked up by
+    name, e.g. ``hostvars[host]['web_host']``.
+    """
+    if not _JINJA:
+        return _scan_blocks(text)
+    try:
+        tree = jinja2.Environment(
+            extensions=["jinja2.ext.do", "jinja2.ext.loopcontrols"]
+        ).parse(text)
+    except jinja2.TemplateSyntaxError:
+        return _scan_blocks(text)
+    names = {n.name for n in tree.find_all(nodes.Name)}
+    names |= {n.attr for n in tree.find_all(nodes.Getattr)}
+    for node in tree.find_all(nodes.Const):
+        if isinstance(node.value, str) and _IDENTIFIER.fullmatch(node.value):
+            names.add(node.value)
+    return names
+
+
+def _walk_yaml(obj: Any, key: str = "") -> Iterator[str]:
+    """Get the variable names that are defined or used in a yaml document."""
+    if isinstance(obj, dict):
+        for sub_key, value in obj.items():
+            if isinstance(sub_key, str):
+                yield sub_key
+            yield from _walk_yaml(value, str(sub_key))
+    elif isinstance(obj, list):
+        for value in obj:
+            yield from _walk_yaml(value, key)
+    elif isinstance(obj, str):
+        if key in EXPRESSION_KEYS and "{{" not in obj:
+            yield from _scan_template(f"{{{{ {obj} }}}}")
+        elif "{{" in obj or "{%" in obj:
+            yield from _scan_template(obj)
+
+
+def _scan_file(path: Path) -> Set[str]:
+    """Get the variable names that are used in a playbook, task or template."""
+    text = path.read_text(errors="ignore")
+    if path.suffix not in (".yml", ".yaml"):
+        return _scan_template(text)
+    try:
+        return set(_walk_yaml(list(yaml.safe_load_all(text))))
+    except yaml.YAMLError:
+        # Ansible specific tags, like !unsafe, can't be loaded.
+        return set(_YAML_KEY.findall(text)) | _scan_blocks(text)
+
+
+def _fingerprint(files: list[Path], playbook_dir: Path) -> str:
+    """Create a fingerprint from the names, sizes and mtimes of files."""
+    sha = hashlib.sha256(str(INDEX_VERSION).encode())
+    for path in files:
+        stat = path.stat()
+        sha.update(
+            f"{path.relative_to(playbook_dir)}:{stat.st_size}:"
+            f"{stat.st_mtime_ns}".encode()
+        )
+    return sha.hexdigest()
+
+
+def get_playbook_variables(playbook_dir: Path | None = None) -> FrozenSet[str]:
+    """Get the names of all variables that are used by the playbooks.
+
+    The index is stored in the user cache directory and only re-created
+    if any file of the playbook directory has changed.
+
+    Parameters
+    ----------
+    playbook_dir: Path, default: None
+        The directory holding the playbooks, roles and templates, defaults
+        to the playbooks of the asset directory.
+
+    Returns
+    -------
+    frozenset[str]: The variable names.
+    """
+    playbook_dir = playbook_dir or asset_dir / "playbooks"
+    files = sorted(p for p in playbook_dir.rglob("*") if p.is_file())
+    fingerprint = _fingerprint(files, playbook_dir)
+    if fingerprint in _index:
+        return _index[fingerprint]
+    try:
+        cache = json.loads(INDEX_FILE.read_text())
+    except (OSError, ValueError):
+        cache = {}
+    if cache.get("fingerprint") == fingerprint:
+        _index[fingerprint] = frozenset(cache.get("variables", []))
+        return _index[fingerprint]
+    logger.debug("Indexing playbook variables in %s", playbook_dir)
+    variables: Set[str] = set()
+    for path in files:
+        variables |= _scan_file(path)
+    _index[fingerprint] = frozenset(variables)
+    try:
+        INDEX_FILE.parent.mkdir(exist_ok=True, parents=True)
+        temp_file = INDEX_FILE.with_suffix(".tmp")
+        temp_file.write_text(
+            json.dumps({"fingerprint": fingerprint, "variables": sorted(variables)})
+        )
+        temp_file.replace(INDEX_FILE)
+    except OSError as error:
+        logger.debug("Could not write playbook variable index: %s", error)
+    return _index[fingerprint]
@@ -0,0 +1,105 @@
+"""Collect the timings of a deployment."""
+
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+from rich.table import Table
+
+from .logger import logger
+from .runner import TaskResultEvent
+from .utils import RichConsole
+
+TaskTiming = NamedTuple(
+    "TaskTiming",
+    [
+        ("play", str),
+        ("role", str),
+        ("task", str),
+        ("host", str),
+        ("duration", float),
+    ],
+)
+
+
+class DeploymentProfiler:
+    """Collect the wall-clock time of all tasks of a deployment.
+
+    The timings are taken from the task results that are reported by the
+    deployment callback plugin.
+
+    Parameters
+    ----------
+    top: int, default: 20
+        The number of entries that are displayed in each summary table.
+    """
+
+    def __init__(self, top: int = 20) -> None:
+        self.top = top
+        self.timings: List[TaskTiming] = []
+        self._lock = threading.Lock()
+
+    def add(self, event: TaskResultEvent) -> None:
+        """Add the timing of a task result."""
+        if not event["event"].startswith("runner_on_") or "end" not in event:
+            return
+        timing = TaskTiming(
+            play=event.get("play", "") or "-",
+            role=event.get("role", "") or "-",
+            task=event.get("task", "") or "-",
+            host=event.get("host", "") or "-",
+            duration=max(event["end"] - event.get("start", event["end"]), 0.0),
+        )
+        with self._lock:
+            self.timings.append(timing)
+
+    def totals(self, key: str) -> List[Tuple[str, float]]:
+        """Get the accumulated time per play, role, task or host.
+
+        Parameters
+        ----------
+        key: str
+            The field to group by, one of play, role, task, host.
+
+        Returns
+        -------
+        list: (name, seconds) pairs, sorted by descending time.
+        """
+        totals: Dict[str, float] = defaultdict(float)
+        for timing in self.timings:
+            totals[getattr(timing, key)] += timing.duration
+        return sorted(totals.items(), key=lambda t: t[1], reverse=True)
+
+    def print_summary(self) -> None:
+        """Display the most time consuming tasks, roles, plays and hosts."""
+        if not self.timings:
+            logger.warning("No task timings have been recorded.")
+            return
+        RichConsole.rule("[b]Deployment profile[/]")
+        for key in ("task", "role", "play", "host"):
+            table = Table(title=f"Top {self.top} {key}s by wall-clock time")
+            table.add_column(key.capitalize(), style="green")
+            table.add_column("Time [s]", justify="right")
+            for name, seconds in self.totals(key)[: self.top]:
+                table.add_row(name, f"{seconds:.2f}")
+            RichConsole.print(table)
+
+    def write_collapsed(self, path: Path) -> None:
+        """Save the timings in collapsed stack format.
+
+        Each line reads ``play;role;task;host <milliseconds>``, the file can
+        be loaded into flamegraph tools like speedscope.
+        """
+        stacks: Dict[str, float] = defaultdict(float)
+        for timing in self.timings:
+            frames = (timing.play, timing.role, timing.task, timing.host)
+            stack = ";".join(f.replace(";", ",") for f in frames)
+            stacks[stack] += timing.duration
+        path.parent.mkdir(exist_ok=True, parents=True)
+        with path.open("w", encoding="utf-8") as f_obj:
+            for stack, seconds in stacks.items():
+                f_obj.write(f"{stack} {int(seconds * 1000)}\n")
+        logger.info("Deployment profile has been written to %s", path)
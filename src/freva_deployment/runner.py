@@ -3,13 +3,30 @@
 import atexit
 import json
 import os
+import queue
+import re
+import shutil
 import sys
-from copy import deepcopy
+import threading
+import time
+import weakref
+from contextlib import nullcontext
 from getpass import getuser
 from multiprocessing import get_context
 from pathlib import Path
-from tempfile import NamedTemporaryFile, TemporaryDirectory
-from typing import Any, Dict, List, Optional, Union
+from subprocess import DEVNULL, run
+from tempfile import NamedTemporaryFile, TemporaryDirectory, mkdtemp
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
 
 import paramiko
 import yaml
@@ -17,11 +34,33 @@ from rich import print as pprint
 from rich.console import Console
 from rich.live import Live
 from rich.spinner import Spinner
+from typing_extensions import NotRequired, TypedDict
 
 from .error import DeploymentError
 from .logger import logger
 from .utils import is_bundeled
 
+try:
+    import msgpack
+
+    _MSGPACK = True
+except ImportError:  # pragma: no cover
+    _MSGPACK = False
+
+
+RemoteFile = NamedTuple(
+    "RemoteFile",
+    [
+        ("host", str),
+        ("path", str),
+        ("content", str),
+        ("size", int),
+        ("duration", float),
+        ("error", str),
+    ],
+)
+"""The content of a file on a remote host, error is empty on success."""
+
 
 def _del_path(inp_path: Path) -> None:
     tmp_path = inp_path.with_suffix(".cfg.tmp")
@@ -32,30 +71,180 @@ def _del_path(inp_path: Path) -> None:
         tmp_path.unlink()
 
 
+def _close_ssh_connections(
+    clients: Dict[Tuple[str, str], paramiko.SSHClient], control_dir: Path
+) -> None:
+    """Close the ssh clients and exit the ssh master connections."""
+    for client in clients.values():
+        client.close()
+    clients.clear()
+    ssh = shutil.which("ssh")
+    if control_dir.is_dir():
+        for socket in control_dir.iterdir():
+            if ssh is None:
+                break
+            run(
+                [ssh, "-o", f"ControlPath={socket}", "-O", "exit", "freva"],
+                stdout=DEVNULL,
+                stderr=DEVNULL,
+                check=False,
+            )
+        shutil.rmtree(control_dir, ignore_errors=True)
+
+
 class SubProcess:
     """Class that holds the exitcode and the stdout of a process."""
 
-    def __init__(
-        self, exitcode: Optional[int], stdout: str = "", log: str = ""
-    ) -> None:
+    def __init__(self, exitcode: Optional[int], stdout: str = "") -> None:
         self.returncode = exitcode or 0
         self.stdout = stdout
-        self.log = log
 
     @classmethod
     def run_ansible_playbook(
         cls,
-        cwd: Path,
+        cwd: str,
         command: List[str],
+        env: Dict[str, str],
+        stdout_file: Optional[str],
+        events: Any,
     ) -> None:
+        """Run ansible-playbook, this is the target of the child process.
+
+        The environment and stdout are only changed in the child, the log
+        events of the callback plugin are sent to the ``events`` queue,
+        which receives ``None`` once the playbook has finished.
+        """
+        # The ansible config is read on import, set up the environment first.
+        os.environ.update(env)
+        import freva_deployment.callback_plugins
         from ansible.cli.playbook import main
 
-        current_dir = os.path.abspath(os.curdir)
+        freva_deployment.callback_plugins.event_queue = events
+        if stdout_file:
+            sys.stdout = open(stdout_file, "w", encoding="utf-8")
         try:
             os.chdir(cwd)
             main(command)
         finally:
-            os.chdir(current_dir)
+            sys.stdout.flush()
+            events.put(None)
+
+
+class TaskResultEvent(TypedDict):
+    """An event reported by the ansible callback plugin.
+
+    Task results (``runner_on_*`` events) carry the task name, host, start
+    and end time and the result, other events (``playbook_on_play_start``,
+    ``playbook_on_stats``) only carry their own information.
+    """
+
+    event: str
+    task: NotRequired[str]
+    action: NotRequired[str]
+    role: NotRequired[str]
+    host: NotRequired[str]
+    start: NotRequired[float]
+    end: NotRequired[float]
+    result: NotRequired[Dict[str, Any]]
+    play: NotRequired[str]
+    time: NotRequired[float]
+    stats: NotRequired[Dict[str, Dict[str, int]]]
+
+
+class AnsibleProcess:
+    """An ansible-playbook run in a child process.
+
+    The log events of the callback plugin are sent to the parent over a
+    queue and can be consumed while the playbook is still running.
+
+    Parameters
+    ----------
+    cwd: str
+        The working directory of the ansible-playbook command.
+    command: list[str]
+        The ansible-playbook command.
+    env: dict[str, str], default: None
+        Additional environment variables of the child process.
+    capture_output: bool, default: False
+        Capture stdout of the child process instead of displaying it.
+    """
+
+    poll_interval: float = 0.5
+    """Time in seconds after which a silent child is checked for liveness."""
+
+    def __init__(
+        self,
+        cwd: str,
+        command: List[str],
+        env: Optional[Dict[str, str]] = None,
+        capture_output: bool = False,
+    ) -> None:
+        self._temp_dir = TemporaryDirectory(prefix="AnsibleRunner")
+        self.stdout_file = Path(self._temp_dir.name) / "stdout.log"
+        self.stdout_file.touch()
+        ctx = get_context()
+        self._queue = ctx.Queue()
+        self._done = False
+        self._proc = ctx.Process(
+            target=SubProcess.run_ansible_playbook,
+            args=(
+                cwd,
+                command,
+                env or {},
+                str(self.stdout_file) if capture_output else None,
+                self._queue,
+            ),
+        )
+        self._proc.start()
+
+    @staticmethod
+    def _decode(record: Union[str, bytes]) -> Optional[TaskResultEvent]:
+        """Decode a json line or, if ``DEPLOYMENT_LOG_FORMAT`` is msgpack,
+        a msgpack record of the callback plugin."""
+        try:
+            if isinstance(record, bytes):
+                if not _MSGPACK:
+                    raise ValueError("msgpack is not installed")
+                return cast(TaskResultEvent, msgpack.unpackb(record, raw=False))
+            return cast(TaskResultEvent, json.loads(record))
+        except ValueError as error:
+            logger.debug("Could not parse %r: %s", record[:80], error)
+        return None
+
+    def events(self) -> Iterator[TaskResultEvent]:
+        """Iterate over the log events as they are reported."""
+        while not self._done:
+            try:
+                batch = self._queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                if not self._proc.is_alive():
+                    # The child died without saying goodbye.
+                    self._done = True
+                continue
+            if batch is None:
+                self._done = True
+                continue
+            for record in batch:
+                event = self._decode(record)
+                if event is not None:
+                    yield event
+
+    def wait(self) -> SubProcess:
+        """Wait for the process to finish.
+
+        Events that haven't been consumed via :py:meth:`events` are
+        discarded.
+        """
+        try:
+            for _ in self.events():
+                pass
+            self._proc.join()
+            return SubProcess(
+                self._proc.exitcode, stdout=self.stdout_file.read_text()
+            )
+        finally:
+            self._queue.close()
+            self._temp_dir.cleanup()
 
 
 def run_command(
@@ -63,35 +252,10 @@ def run_command(
     command: List[str],
     env: Optional[Dict[str, str]] = None,
     capture_output: bool = False,
-):
-    os_env = deepcopy(os.environ)
-    env = env or {}
-    stdout = sys.stdout
-    with TemporaryDirectory(prefix="AnsibleRunner") as temp_dir:
-        logger_file = Path(temp_dir) / "logger.log"
-        logger_file.touch()
-        stdout_file = Path(temp_dir) / "stdout.log"
-        env["DEPLOYMENT_LOG_PATH"] = str(logger_file)
-        stdout_buffer = stdout_file.open("w")
-        try:
-            os.environ.update(env)
-            if capture_output:
-                sys.stdout = stdout_buffer
-            ctx = get_context()
-            proc = ctx.Process(
-                target=SubProcess.run_ansible_playbook, args=(cwd, command)
-            )
-            proc.start()
-            proc.join()
-        finally:
-            os.environ = os_env
-            sys.stdout = stdout
-            stdout_buffer.close()
-        return SubProcess(
-            proc.exitcode,
-            stdout=stdout_file.read_text(),
-            log=logger_file.read_text(),
-        )
+) -> SubProcess:
+    return AnsibleProcess(
+        cwd, command, env=env, capture_output=capture_output
+    ).wait()
 
 
 def run_command_with_spinner(
@@ -117,9 +281,25 @@ def run_command_with_spinner(
 class RunnerDir(TemporaryDirectory):
     """Define and create the Ansible runner directory."""
 
+    ssh_control_persist: str = "15m"
+    """Time ssh master connections are kept open after the last use."""
+
     def __init__(self) -> None:
         super().__init__(prefix="AnsibleRunner")
         self.parent_dir = Path(self.name)
+        # Unix socket paths are limited to ~100 characters, hence we can't
+        # use the (potentially long) runner dir for the ssh control sockets.
+        self.ssh_control_dir = Path(
+            mkdtemp(prefix="freva-ssh-", dir="/tmp" if os.path.isdir("/tmp") else None)
+        )
+        self._ssh_clients: Dict[Tuple[str, str], paramiko.SSHClient] = {}
+        self._ssh_lock = threading.Lock()
+        self._ssh_host_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        # Make sure the connections are closed even if cleanup isn't called,
+        # e.g. if the runner isn't used as context manager or interrupted.
+        self._ssh_finalizer = weakref.finalize(
+            self, _close_ssh_connections, self._ssh_clients, self.ssh_control_dir
+        )
         self.env_dir = self.parent_dir / "env"
         self.inventory_dir = self.parent_dir / "inventory"
         self.project_dir = self.parent_dir / "project"
@@ -136,6 +316,107 @@ class RunnerDir(TemporaryDirectory):
             )
         atexit.register(_del_path, self.ansible_config_file)
 
+    @property
+    def ssh_control_args(self) -> str:
+        """Ssh arguments to share connections amongst ansible invocations."""
+        return (
+            "-o ControlMaster=auto "
+            f"-o ControlPersist={self.ssh_control_persist} "
+            f"-o ControlPath={self.ssh_control_dir}/%C"
+        )
+
+    def cleanup(self) -> None:
+        """Close all shared ssh connections and delete the runner dir."""
+        self._ssh_finalizer()
+        super().cleanup()
+
+    def _get_ssh_client(
+        self,
+        host: str,
+        username: str,
+        password: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> paramiko.SSHClient:
+        """Get an ssh connection to a host, connections are reused.
+
+        Keys of known hosts are verified, keys of unknown hosts are accepted
+        just like the ansible connections do.
+        """
+        with self._ssh_lock:
+            lock = self._ssh_host_locks.setdefault((host, username), threading.Lock())
+        with lock:
+            client = self._ssh_clients.get((host, username))
+            transport = client.get_transport() if client else None
+            if client is not None and transport is not None and transport.is_active():
+                return client
+            logger.debug("Connecting to %s with %s", host, username)
+            client = paramiko.SSHClient()
+            try:
+                client.load_system_host_keys()
+            except OSError:
+                pass
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(
+                host,
+                username=username,
+                password=password or None,
+                timeout=timeout,
+                banner_timeout=timeout,
+                auth_timeout=timeout,
+            )
+            self._ssh_clients[(host, username)] = client
+            return client
+
+    @staticmethod
+    def _expand_remote_path(
+        client: paramiko.SSHClient, sftp: paramiko.SFTPClient, path: str
+    ) -> str:
+        """Expand ``~``, ``~user`` and ``$HOME`` like the remote shell would."""
+        # The sftp session starts in the home directory of the user.
+        home = sftp.normalize(".")
+        for prefix in ("~", "$HOME", "${HOME}"):
+            if path == prefix:
+                return home
+            if path.startswith(prefix + "/"):
+                return home + path[len(prefix) :]
+        match = re.match(r"~([A-Za-z0-9._-]+)(/.*)?$", path)
+        if match:
+            _, stdout, _ = client.exec_command(f"echo ~{match.group(1)}")
+            user_home = stdout.read().decode("utf-8").strip()
+            if user_home and not user_home.startswith("~"):
+                return user_home + (match.group(2) or "")
+        return path
+
+    def _read_remote_file(
+        self,
+        host: str,
+        path: str,
+        username: str,
+        password: Optional[str],
+        max_size: int,
+        timeout: float,
+    ) -> RemoteFile:
+        """Read a single file via sftp."""
+        start = time.monotonic()
+        size = 0
+        try:
+            client = self._get_ssh_client(host, username, password, timeout)
+            with client.open_sftp() as sftp:
+                sftp.get_channel().settimeout(timeout)
+                remote_path = self._expand_remote_path(client, sftp, path)
+                size = sftp.stat(remote_path).st_size or 0
+                if size > max_size:
+                    raise ValueError(f"file size {size} exceeds {max_size} bytes")
+                with sftp.open(remote_path, "rb") as f_obj:
+                    content = f_obj.read(max_size + 1).decode("utf-8")
+        except Exception as error:
+            duration = time.monotonic() - start
+            logger.debug("Couldn't read %s:%s: %s", host, path, error)
+            return RemoteFile(host, path, "", size, duration, str(error) or repr(error))
+        duration = time.monotonic() - start
+        logger.debug("Read %s:%s (%i bytes) in %.2fs", host, path, size, duration)
+        return RemoteFile(host, path, content.strip(), size, duration, "")
+
     def create_config(self, **kwargs: str) -> None:
         """Create an ansible config."""
         self.ansible_config_file.parent.mkdir(exist_ok=True, parents=True)
@@ -226,19 +507,28 @@ class RunnerDir(TemporaryDirectory):
         *file_paths: str,
         username: Optional[str] = None,
         password: Optional[str] = None,
+        max_size: int = 1024**2,
+        timeout: float = 30.0,
     ) -> str:
-        """Get the content of a remote file.
+        """Get the content of the first readable of a couple of remote files.
+
+        The files are read via sftp in the given order, the ssh connection
+        to the host is reused.
 
         Parameters
         ----------
         host: str
             Remote hostname
         file_paths: str
-            The paths to the file containing the target content
+            The candidate paths of the file containing the target content
         username: str, default: None
             Use this username to log on
         password: str, default: None
             Instead of logging on by ssh key, use a password based log in.
+        max_size: int, default: 1 MB
+            Files that are bigger than this (in bytes) are not read.
+        timeout: float, default: 30
+            Timeout in seconds for connecting to the host and reading a file.
 
         Returns
         -------
@@ -247,62 +537,34 @@ class RunnerDir(TemporaryDirectory):
         if not host:
             return ""
         username = username or getuser()
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        file_content = ""
-        try:
-            logger.debug("Connecting to %s with %s", host, username)
-            ssh.connect(host, username=username, password=password or None)
-            for file_path in file_paths:
-                _, stdout, stderr = ssh.exec_command(f"cat {file_path}")
-                if stderr.channel.recv_exit_status() == 0:
-                    file_content = stdout.read().decode("utf-8").strip()
-                    break
-        except Exception as error:
-            logger.critical("Couldn't establish connection to %s: %s", host, error)
-        finally:
-            ssh.close()
-        return file_content
+        errors = []
+        for file_path in file_paths:
+            remote_file = self._read_remote_file(
+                host, file_path, username, password, max_size, timeout
+            )
+            if not remote_file.error:
+                return remote_file.content
+            errors.append(remote_file.error)
+        logger.critical("Couldn't read any file on %s: %s", host, ", ".join(errors))
+        return ""
 
-    def run_ansible_playbook(
+    def _create_command(
         self,
         playbook: Optional[Union[str, Path, List[Any], Dict[str, Any]]],
         inventory: Optional[Union[str, Path, List[Any], Dict[str, Any]]],
-        working_dir: Optional[Union[str, Path]] = None,
-        envvars: Optional[Dict[str, str]] = None,
+        envvars: Dict[str, str],
         extravars: Optional[Dict[str, str]] = None,
         tags: Optional[List[str]] = None,
         cmdline: Optional[str] = None,
         verbosity: int = 0,
         passwords: Optional[Dict[str, str]] = None,
-        hide_output: bool = False,
-        text: str = "Running playbook ...",
-        output: str = "",
-    ) -> str:
-        """
-        Run an Ansible playbook using multiprocessing.
-
-        Parameters:
-        working_dir (str): Current working directory for the playbooks.
-        playbook_path (str): Path to the playbook.
-        inventory_path (str): Path to the inventory file.
-        envvars (Optional[Dict[str, str]]): Environment variables to set for Ansible.
-        extravars (Optional[Dict[str, str]]): Extra variables to pass to Ansible.
-        cmdline (Optional[str]): Extra command line arguments for Ansible.
-        verbosity (int): Verbosity level for Ansible output.
-        tags (Optional[List[str]]): The roles that should be involved.
-        hide_output (bool): Hide stdout and stderr if True, show only on failure.
-
-        Raises:
-        DeploymentError: If the Ansible playbook execution fails.
-        """
+    ) -> List[str]:
+        """Create the ansible-playbook command."""
         tags = tags or []
-        working_dir = Path(working_dir or "").expanduser().absolute()
         playbook_path = self.convert_to_file(playbook or "")
         inventory_path = self.convert_to_file(inventory or "")
         passwords = passwords or {}
         extravars = extravars or {}
-        envvars = envvars or {}
         # Prepare the command
 
         command = ["ansible-playbook", playbook_path, "-i", inventory_path]
@@ -326,13 +588,136 @@ class RunnerDir(TemporaryDirectory):
         if verbosity > 0:
             command.append("-" + "v" * verbosity)
         logger.debug("Running ansible command %s", " ".join(command))
+        return command
+
+    def iter_ansible_playbook(
+        self,
+        playbook: Optional[Union[str, Path, List[Any], Dict[str, Any]]],
+        inventory: Optional[Union[str, Path, List[Any], Dict[str, Any]]],
+        working_dir: Optional[Union[str, Path]] = None,
+        envvars: Optional[Dict[str, str]] = None,
+        extravars: Optional[Dict[str, str]] = None,
+        tags: Optional[List[str]] = None,
+        cmdline: Optional[str] = None,
+        verbosity: int = 0,
+        passwords: Optional[Dict[str, str]] = None,
+        hide_output: bool = False,
+        text: str = "Running playbook ...",
+        capture_output: bool = False,
+    ) -> Iterator[TaskResultEvent]:
+        """
+        Run an Ansible playbook and iterate over its task results.
+
+        The task results are yielded while the playbook is running. Parameters
+        are the same as for :py:meth:`run_ansible_playbook`.
+
+        Raises:
+        DeploymentError: If the Ansible playbook execution fails.
+        """
+        envvars = envvars or {}
+        working_dir = Path(working_dir or "").expanduser().absolute()
+        command = self._create_command(
+            playbook,
+            inventory,
+            envvars,
+            extravars=extravars,
+            tags=tags,
+            cmdline=cmdline,
+            verbosity=verbosity,
+            passwords=passwords,
+        )
+        show_spinner = hide_output and verbosity == 0
+        spinner = Spinner("weather", text=text)
+        display = (
+            Live(spinner, refresh_per_second=3, console=Console(stderr=True))
+            if show_spinner
+            else nullcontext()
+        )
+        with display:
+            proc = AnsibleProcess(
+                str(working_dir),
+                command,
+                env=envvars,
+                capture_output=show_spinner or capture_output,
+            )
+            try:
+                yield from proc.events()
+            except KeyboardInterrupt:
+                spinner.update(text=text + " [yellow]canceled[/yellow]")
+                raise KeyboardInterrupt("User interrupted execution") from None
+            finally:
+                result = proc.wait()
+            if result.returncode == 0:
+                spinner.update(text=text + " [green]ok[/green]")
+            else:
+                spinner.update(text=text + " [red]failed[/red]")
+        if result.returncode != 0:
+            pprint(result.stdout)
+            raise DeploymentError("Deployment failed!")
+        if capture_output and not show_spinner:
+            sys.stdout.write(result.stdout)
+            sys.stdout.flush()
+
+    def run_ansible_playbook(
+        self,
+        playbook: Optional[Union[str, Path, List[Any], Dict[str, Any]]],
+        inventory: Optional[Union[str, Path, List[Any], Dict[str, Any]]],
+        working_dir: Optional[Union[str, Path]] = None,
+        envvars: Optional[Dict[str, str]] = None,
+        extravars: Optional[Dict[str, str]] = None,
+        tags: Optional[List[str]] = None,
+        cmdline: Optional[str] = None,
+        verbosity: int = 0,
+        passwords: Optional[Dict[str, str]] = None,
+        hide_output: bool = False,
+        text: str = "Running playbook ...",
+        output: str = "",
+        capture_output: bool = False,
+    ) -> None:
+        """
+        Run an Ansible playbook using multiprocessing.
+
+        Parameters:
+        working_dir (str): Current working directory for the playbooks.
+        playbook_path (str): Path to the playbook.
+        inventory_path (str): Path to the inventory file.
+        envvars (Optional[Dict[str, str]]): Environment variables to set for Ansible.
+        extravars (Optional[Dict[str, str]]): Extra variables to pass to Ansible.
+        cmdline (Optional[str]): Extra command line arguments for Ansible.
+        verbosity (int): Verbosity level for Ansible output.
+        tags (Optional[List[str]]): The roles that should be involved.
+        hide_output (bool): Hide stdout and stderr if True, show only on failure.
+        capture_output (bool): Buffer the output and display it at once when
+                               the playbook has finished.
+
+        Raises:
+        DeploymentError: If the Ansible playbook execution fails.
+        """
+        envvars = envvars or {}
+        working_dir = Path(working_dir or "").expanduser().absolute()
+        command = self._create_command(
+            playbook,
+            inventory,
+            envvars,
+            extravars=extravars,
+            tags=tags,
+            cmdline=cmdline,
+            verbosity=verbosity,
+            passwords=passwords,
+        )
         # Run the command
         if hide_output and verbosity == 0:
             result = run_command_with_spinner(str(working_dir), command, envvars, text)
         else:
             result = run_command(
-                str(working_dir), command, env=envvars, capture_output=False
+                str(working_dir),
+                command,
+                env=envvars,
+                capture_output=capture_output,
             )
+            if capture_output and result.returncode == 0:
+                sys.stdout.write(result.stdout)
+                sys.stdout.flush()
 
         # Determine if the command was successful
         success = result.returncode == 0
@@ -340,4 +725,3 @@ class RunnerDir(TemporaryDirectory):
         if not success:
             pprint(result.stdout)
             raise DeploymentError("Deployment failed!")
-        return result.log
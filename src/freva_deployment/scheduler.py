@@ -0,0 +1,211 @@
+"""Schedule the plays of the main deployment playbook in parallel."""
+
+from __future__ import annotations
+
+import re
+import shutil
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import yaml
+
+from .logger import logger
+
+PLAY_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    "vault": ("database",),
+    "data-loader": ("cache",),
+    "freva-rest": (
+        "vault",
+        "cache",
+        "data-loader",
+        "mongodb_server",
+        "search_server",
+    ),
+    "web-prep": ("core",),
+    "web": ("web-prep", "freva-rest", "vault"),
+}
+"""Roles that have to be deployed before a given role can be deployed."""
+
+
+class PlayNode:
+    """A single play of the main deployment playbook.
+
+    Parameters
+    ----------
+    index: int
+        The position of the play in the playbook.
+    play: dict
+        The content of the play.
+    hosts: set[str]
+        The host names the play is targeting.
+    """
+
+    def __init__(self, index: int, play: Dict[str, Any], hosts: Set[str]) -> None:
+        self.index = index
+        self.play = play
+        self.hosts = hosts
+        self.name: str = play.get("name") or play.get("hosts", "")
+        self.tags: List[str] = play.get("tags", [])
+        roles = [
+            r.get("role", "") if isinstance(r, dict) else r
+            for r in play.get("roles", [])
+        ]
+        self.role: str = roles[0] if roles else ""
+        self.depends_on: Set[int] = set()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.index}, {self.name!r})"
+
+
+def _get_hosts(inventory: Dict[str, Any], group: str) -> Set[str]:
+    """Get all host names of an inventory group."""
+    hosts = (inventory.get(group) or {}).get("hosts") or ""
+    if isinstance(hosts, dict):
+        return set(hosts)
+    return {h for h in re.split(r"[,\s]+", str(hosts)) if h}
+
+
+class PlayScheduler:
+    """Run independent plays of a playbook at the same time.
+
+    The plays of the playbook are arranged in a dependency graph. A play
+    depends on all earlier plays that deploy roles listed in
+    :py:data:`PLAY_DEPENDENCIES` and on all earlier plays that target any of
+    its hosts. Plays that do not deploy a role (plain tasks) wait for all
+    earlier plays.
+
+    Parameters
+    ----------
+    playbook: Path
+        Path to the playbook that should be split into plays.
+    inventory: str
+        The yaml representation of the ansible inventory.
+    tags: list[str]
+        Only plays that are tagged with any of those tags are played.
+    max_workers: int, default: 1
+        The maximum number of plays that are played at the same time.
+    """
+
+    def __init__(
+        self,
+        playbook: Path,
+        inventory: str,
+        tags: List[str],
+        max_workers: int = 1,
+    ) -> None:
+        self.playbook = playbook
+        self.max_workers = max(max_workers, 1)
+        inventory_dict: Dict[str, Any] = yaml.safe_load(inventory) or {}
+        self._plays = [
+            PlayNode(nn, play, _get_hosts(inventory_dict, play.get("hosts", "")))
+            for nn, play in enumerate(yaml.safe_load(playbook.read_text()) or [])
+        ]
+        self.nodes = [p for p in self._plays if set(p.tags) & set(tags)]
+        self._resolve_dependencies()
+
+    def _direct_dependencies(self, node: PlayNode) -> Set[int]:
+        """Get the indices of all plays a play depends on."""
+        previous = self._plays[: node.index]
+        if not node.role:
+            return {p.index for p in previous}
+        roles = PLAY_DEPENDENCIES.get(node.role, ())
+        return {p.index for p in previous if p.role and p.role in roles}
+
+    def _resolve_dependencies(self) -> None:
+        """Create the dependency graph of all selected plays."""
+        selected = {p.index for p in self.nodes}
+        for node in self.nodes:
+            stack = list(self._direct_dependencies(node))
+            seen: Set[int] = set()
+            while stack:
+                index = stack.pop()
+                if index in seen:
+                    continue
+                seen.add(index)
+                if index in selected:
+                    node.depends_on.add(index)
+                else:
+                    # Plays that are not deployed still have to wait for
+                    # whatever those plays would have been waiting for.
+                    stack += list(self._direct_dependencies(self._plays[index]))
+            for other in self.nodes:
+                if other.index < node.index and other.hosts & node.hosts:
+                    node.depends_on.add(other.index)
+
+    def write_playbooks(self, work_dir: Path) -> Dict[int, Path]:
+        """Write every selected play into a playbook of its own.
+
+        The roles, tasks, templates and variables of the original playbook
+        directory are linked into ``work_dir`` to keep relative paths valid.
+        """
+        work_dir.mkdir(exist_ok=True, parents=True)
+        for source in self.playbook.parent.iterdir():
+            target = work_dir / source.name
+            if source == self.playbook or target.exists():
+                continue
+            try:
+                target.symlink_to(source, target_is_directory=source.is_dir())
+            except OSError:
+                if source.is_dir():
+                    shutil.copytree(source, target)
+                else:
+                    shutil.copy2(source, target)
+        playbooks = {}
+        for node in self.nodes:
+            play_file = work_dir / f"play-{node.index:02d}.yml"
+            play_file.write_text(yaml.safe_dump([node.play]))
+            playbooks[node.index] = play_file
+        return playbooks
+
+    def run(
+        self,
+        play_func: Callable[[Path, str], Any],
+        work_dir: Path,
+    ) -> None:
+        """Play all selected plays.
+
+        Parameters
+        ----------
+        play_func: Callable
+            Function that plays a single playbook, it takes the path to the
+            playbook and the name of the play as arguments.
+        work_dir: Path
+            Directory where the playbooks of the single plays are stored.
+
+        Raises
+        ------
+        DeploymentError:
+            If any of the plays failed, plays that depend on the failed play
+            are not played.
+        """
+        playbooks = self.write_playbooks(work_dir)
+        pending = {n.index: n for n in self.nodes}
+        done: Set[int] = set()
+        error: Optional[BaseException] = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running: Dict[Future[Any], PlayNode] = {}
+            while pending or running:
+                if error is None:
+                    for index, node in list(pending.items()):
+                        if node.depends_on <= done:
+                            logger.info("Starting play: %s", node.name)
+                            future = pool.submit(
+                                play_func, playbooks[index], node.name
+                            )
+                            running[future] = pending.pop(index)
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    node = running.pop(future)
+                    try:
+                        future.result()
+                    except BaseException as exc:
+                        logger.error("Play failed: %s", node.name)
+                        error = error or exc
+                    else:
+                        logger.info("Play finished: %s", node.name)
+                        done.add(node.index)
+        if error is not None:
+            raise error
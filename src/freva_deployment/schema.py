@@ -0,0 +1,181 @@
+"""Versioned schema patches for databases migrated from old freva instances."""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, List, NamedTuple, Set, Tuple
+
+import pymysql
+from rich.prompt import Confirm
+
+from .logger import logger
+from .utils import is_interactive
+
+TRACKING_TABLE = "freva_schema_patches"
+"""Table that records the patches that have been applied."""
+
+REBUILD_RATE = float(os.getenv("FREVA_DEPLOYMENT_REBUILD_RATE", str(50 * 1024**2)))
+"""Assumed number of bytes per second a table rebuild copies."""
+
+LOCK_WAIT_TIMEOUT = 5
+"""Seconds an ALTER waits for the metadata lock before it is retried."""
+
+SchemaPatch = NamedTuple(
+    "SchemaPatch",
+    [
+        ("version", int),
+        ("table", str),
+        ("column", str),
+        ("definition", str),
+    ],
+)
+"""A column that is added to a table of the old database schema."""
+
+PATCHES: Tuple[SchemaPatch, ...] = (
+    SchemaPatch(1, "history_history", "host", "longtext"),
+)
+"""All schema patches, ordered by their version."""
+
+_NOT_SUPPORTED = (1064, 1845, 1846)
+"""Error codes of alter algorithms that the server can't use."""
+
+_LOCK_TIMEOUT = 1205
+
+
+def _get_missing_columns(
+    cursor: Any, db: str, patches: List[SchemaPatch]
+) -> Set[Tuple[str, str]]:
+    """Get the (table, column) pairs of the patches that don't exist yet."""
+    if not patches:
+        return set()
+    pairs = ", ".join(["(%s, %s)"] * len(patches))
+    args: List[str] = [db]
+    for patch in patches:
+        args += [patch.table, patch.column]
+    cursor.execute(
+        "SELECT TABLE_NAME, COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
+        f"WHERE TABLE_SCHEMA=%s AND (TABLE_NAME, COLUMN_NAME) IN ({pairs})",
+        args,
+    )
+    found = {(t.lower(), c.lower()) for t, c in cursor.fetchall()}
+    return {
+        (p.table, p.column)
+        for p in patches
+        if (p.table.lower(), p.column.lower()) not in found
+    }
+
+
+def _get_table_size(cursor: Any, db: str, table: str) -> int:
+    """Get the size of the data and indexes of a table in bytes."""
+    cursor.execute(
+        "SELECT COALESCE(DATA_LENGTH + INDEX_LENGTH, 0) "
+        "FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s",
+        (db, table),
+    )
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+
+def _alter(cursor: Any, statement: str, retries: int = 5) -> None:
+    """Run an ALTER statement, retry if the metadata lock isn't granted.
+
+    A pending ALTER blocks all queries on the table that arrive after it,
+    the short lock wait timeout keeps the web ui responsive while long
+    running queries hold the table.
+    """
+    for attempt in range(retries):
+        try:
+            cursor.execute(statement)
+            return
+        except pymysql.err.OperationalError as error:
+            if error.args[0] != _LOCK_TIMEOUT or attempt == retries - 1:
+                raise
+            logger.debug("Table is busy, retrying: %s", statement)
+            time.sleep(2**attempt)
+
+
+def _apply(cursor: Any, db: str, patch: SchemaPatch, online: bool) -> None:
+    """Apply a patch, prefer algorithms that don't rebuild the table."""
+    statement = (
+        f"ALTER TABLE `{patch.table}` ADD COLUMN `{patch.column}` {patch.definition}"
+    )
+    if online:
+        for algorithm in ("ALGORITHM=INSTANT", "ALGORITHM=INPLACE, LOCK=NONE"):
+            try:
+                _alter(cursor, f"{statement}, {algorithm}")
+                logger.debug("Applied patch %i with %s", patch.version, algorithm)
+                return
+            except (
+                pymysql.err.OperationalError,
+                pymysql.err.ProgrammingError,
+                pymysql.err.NotSupportedError,
+            ) as error:
+                if error.args[0] not in _NOT_SUPPORTED:
+                    raise
+    size = _get_table_size(cursor, db, patch.table)
+    logger.warning(
+        "Adding `%s` needs a rebuild of `%s` (%.1f MB), the table is locked "
+        "for about %.0fs.",
+        patch.column,
+        patch.table,
+        size / 1024**2,
+        size / REBUILD_RATE,
+    )
+    if is_interactive() and not Confirm.ask(
+        f"[green]Rebuild table {patch.table}?[/green]", default=True
+    ):
+        raise KeyboardInterrupt("Schema patch aborted.")
+    _alter(cursor, statement)
+
+
+def apply_schema_patches(con: Any, db: str, online: bool = True) -> List[int]:
+    """Apply all schema patches that haven't been applied yet.
+
+    Parameters
+    ----------
+    con: pymysql.Connection
+        Connection to the database, in autocommit mode.
+    db: str
+        Name of the database.
+    online: bool, default: True
+        Use INSTANT or INPLACE alter algorithms if the server supports them.
+
+    Returns
+    -------
+    list[int]: The versions of the patches that were applied.
+    """
+    applied: List[int] = []
+    with con.cursor() as cursor:
+        cursor.execute(f"SET SESSION lock_wait_timeout={LOCK_WAIT_TIMEOUT}")
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS `{TRACKING_TABLE}` ("
+            "version INT NOT NULL PRIMARY KEY, "
+            "description VARCHAR(255) NOT NULL, "
+            "duration DOUBLE NOT NULL DEFAULT 0, "
+            "applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+        cursor.execute(f"SELECT version FROM `{TRACKING_TABLE}`")
+        done = {int(r[0]) for r in cursor.fetchall()}
+        pending = [p for p in PATCHES if p.version not in done]
+        missing = _get_missing_columns(cursor, db, pending)
+        for patch in pending:
+            start = time.monotonic()
+            if (patch.table, patch.column) in missing:
+                logger.info(
+                    "Adding new column `%s` to table `%s`.",
+                    patch.column,
+                    patch.table,
+                )
+                _apply(cursor, db, patch, online)
+                applied.append(patch.version)
+            cursor.execute(
+                f"INSERT INTO `{TRACKING_TABLE}` (version, description, duration) "
+                "VALUES (%s, %s, %s)",
+                (
+                    patch.version,
+                    f"add {patch.table}.{patch.column} {patch.definition}",
+                    time.monotonic() - start,
+                ),
+            )
+    return applied
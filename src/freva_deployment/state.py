@@ -0,0 +1,171 @@
+"""Remember the inputs of deployed steps to skip steps that haven't changed."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from .logger import logger
+from .utils import asset_dir
+from .versions import VERSION_CACHE_FILE
+
+VOLATILE_VARS = frozenset(
+    (
+        "db_passwd",
+        "vault_passwd",
+        "freva_rest_db_user",
+        "freva_rest_db_passwd",
+        "mongodb_server_db_user",
+        "mongodb_server_db_passwd",
+        "redis_information",
+        "data_portal_scheduler_information",
+        "data_portal_hosts_information",
+        "web_redis_username",
+        "web_redis_password",
+    )
+)
+"""Variables that are re-created on every run and can't be compared."""
+
+SECRET_VARS = re.compile(r"(pass|passwd|password)$")
+"""Variables that are set by the user but shouldn't be hashed in clear text."""
+
+SHARED_INPUTS = (
+    Path("playbooks") / "tasks",
+    Path("playbooks") / "templates",
+    Path("playbooks") / "vars.yml",
+    Path("scripts"),
+)
+"""Asset files that are used by all roles."""
+
+
+def _normalise(value: Any) -> Any:
+    """Bring a value into a form that doesn't depend on the run."""
+    if isinstance(value, dict):
+        return {k: _normalise(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        values = [_normalise(v) for v in value]
+        if all(isinstance(v, str) for v in values):
+            # Lists of hosts and aliases are created from sets.
+            return sorted(values)
+        return values
+    return value
+
+
+def _get_vars(
+    variables: Dict[str, Any], volatile: Iterable[str] = ()
+) -> Dict[str, Any]:
+    """Get the variables of a group that can be compared between runs."""
+    volatile = VOLATILE_VARS.union(volatile)
+    comparable: Dict[str, Any] = {}
+    for key, value in variables.items():
+        if key in volatile:
+            continue
+        if SECRET_VARS.search(key):
+            value = hashlib.sha256(str(value).encode("utf-8")).hexdigest()
+        comparable[key] = value
+    return comparable
+
+
+def _get_files(paths: Iterable[Path]) -> List[Path]:
+    """Get all files below a couple of paths, sorted by name."""
+    files: Set[Path] = set()
+    for path in paths:
+        if path.is_file():
+            files.add(path)
+        elif path.is_dir():
+            files |= {p for p in path.rglob("*") if p.is_file()}
+    return sorted(files)
+
+
+def hash_step(
+    step: str,
+    config: Dict[str, Any],
+    playbook: List[Dict[str, Any]],
+    versions: Dict[str, str],
+    ignore: Iterable[str] = (),
+    volatile: Iterable[str] = (),
+) -> str:
+    """Create a fingerprint of everything that goes into a deployment step.
+
+    Parameters
+    ----------
+    step: str
+        The name of the deployment step, e.g. freva_rest.
+    config: dict
+        The parsed inventory of the deployment.
+    playbook: list[dict]
+        The content of the main deployment playbook.
+    versions: dict[str, str]
+        The versions of the services that are deployed.
+    ignore: list[str], default: ()
+        Strings, like temporary paths, that should be removed from the
+        variables before hashing.
+    volatile: list[str], default: ()
+        Variables, in addition to ``VOLATILE_VARS``, that are created anew
+        on every run, like the content of generated certificates.
+
+    Returns
+    -------
+    str: The sha256 hex digest of the rendered variables, role files and
+         service versions of the step.
+    """
+    plays = [p for p in playbook if step in p.get("tags", [])]
+    groups = sorted({p["hosts"] for p in plays if p.get("hosts")})
+    roles = sorted(
+        {r for p in plays for r in p.get("roles", []) if isinstance(r, str)}
+    )
+    inputs: Dict[str, Any] = {"versions": versions, "groups": {}}
+    for group in groups:
+        inputs["groups"][group] = {
+            "hosts": config.get(group, {}).get("hosts", ""),
+            "vars": _get_vars(config.get(group, {}).get("vars", {}), volatile),
+        }
+    rendered = json.dumps(_normalise(inputs), sort_keys=True, default=str)
+    for string in ignore:
+        if string:
+            rendered = rendered.replace(string, "")
+    sha = hashlib.sha256(rendered.encode("utf-8"))
+    paths = [asset_dir / "playbooks" / "roles" / r for r in roles]
+    for path in _get_files(paths + [asset_dir / p for p in SHARED_INPUTS]):
+        sha.update(str(path.relative_to(asset_dir)).encode("utf-8"))
+        sha.update(path.read_bytes())
+    return sha.hexdigest()
+
+
+class DeploymentState:
+    """Fingerprints of the steps that were last deployed successfully.
+
+    Parameters
+    ----------
+    project_name: str
+        The name of the project the state belongs to.
+    """
+
+    def __init__(self, project_name: str) -> None:
+        self.path = VERSION_CACHE_FILE.parent / "state" / f"{project_name}.json"
+        try:
+            self._state: Dict[str, Dict[str, Any]] = json.loads(
+                self.path.read_text()
+            )
+        except (OSError, ValueError):
+            self._state = {}
+
+    def get(self, step: str) -> Optional[str]:
+        """Get the fingerprint of the last deployment of a step."""
+        return self._state.get(step, {}).get("hash")
+
+    def set(self, step: str, digest: str) -> None:
+        """Set the fingerprint of a step that has been deployed."""
+        self._state[step] = {"hash": digest, "timestamp": time.time()}
+
+    def save(self) -> None:
+        """Write the state to disk."""
+        try:
+            self.path.parent.mkdir(exist_ok=True, parents=True)
+            self.path.write_text(json.dumps(self._state, indent=3))
+        except OSError as error:
+            logger.debug("Could not write deployment state: %s", error)
@@ -20,7 +20,7 @@ def tui(args: argparse.Namespace) -> None:
         main_app.run()
     except (KeyboardInterrupt, Exception) as error:
         try:
-            main_app.thread_stop.set()
+            main_app.stop_auto_save()
             main_app.save_config_to_file(
                 save_file=main_app._setup_form.inventory_file.value
             )
@@ -39,7 +39,7 @@ def tui(args: argparse.Namespace) -> None:
             logger.error("Exiting App: %s", msg)
         return
     setup = main_app.setup
-    main_app.thread_stop.set()
+    main_app.stop_auto_save()
     if setup:
         ask_pass = setup.pop("ask_pass")
         ssh_port = setup.pop("ssh_port")
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import curses
-import json
 import logging
 import os
 import re
@@ -345,8 +344,7 @@ class BaseForm(
 
     def clear_cache(self):
         """Clear the app cache."""
-        with open(self.parentApp.cache_dir / "freva_deployment.json", "w") as f:
-            json.dump({}, f, indent=3)
+        self.parentApp.write_cache({})
         self.parentApp.reset()
 
     def setTheme(self, theme: str) -> None:
@@ -190,6 +190,19 @@ class CoreScreen(BaseForm):
                 ),
                 True,
             ),
+            git_ref=(
+                self.add_widget_intelligent(
+                    TextInfo,
+                    section="core",
+                    key="git_ref",
+                    name=(
+                        f"{self.num}Branch, tag or commit of the core library - "
+                        "leave blank for the default branch"
+                    ),
+                    value=cfg.get("git_ref", ""),
+                ),
+                False,
+            ),
             ansible_python_interpreter=(
                 self.add_widget_intelligent(
                     TextInfo,
@@ -972,7 +985,7 @@ class RunForm(npyscreen.FormMultiPageAction):
             "gen_keys": bool(gen_keys),
             "secrets_file": self.secrets_file.value or None,
         }
-        self.parentApp.thread_stop.set()
+        self.parentApp.stop_auto_save()
         self.parentApp.exit_application(
             save_file=save_file, msg="Do you want to continue?"
         )
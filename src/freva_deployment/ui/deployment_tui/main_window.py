@@ -4,6 +4,7 @@ deployment setup for a new instance of freva."""
 from __future__ import annotations
 
 import json
+import os
 import signal
 import threading
 import time
@@ -32,6 +33,8 @@ def interrupt(*args: Any) -> None:
 
 class MainApp(npyscreen.NPSAppManaged):
     config: dict[str, Any] = dict()
+    save_delay: float = 1.0
+    """Seconds without any key press before changes are auto saved."""
 
     @property
     def steps(self) -> list[str]:
@@ -52,6 +55,9 @@ class MainApp(npyscreen.NPSAppManaged):
         self.init()
         self._auto_save_active = False
         self.thread_stop = threading.Event()
+        self._dirty = threading.Event()
+        self._last_edit = 0.0
+        self._save_lock = threading.RLock()
         self.start_auto_save()
         signal.signal(signal.SIGINT, interrupt)
 
@@ -77,6 +83,16 @@ class MainApp(npyscreen.NPSAppManaged):
         npyscreen.blank_terminal()
         self.init()
 
+    def adjust_widgets(self) -> None:
+        """Mark the configuration as changed, called on every key press."""
+        self._last_edit = time.monotonic()
+        self._dirty.set()
+
+    def stop_auto_save(self) -> None:
+        """Stop the auto save thread."""
+        self.thread_stop.set()
+        self._dirty.set()
+
     def start_auto_save(self) -> None:
         """(Re)-Start the auto save thread."""
         self._save_thread = threading.Thread(target=self._auto_save)
@@ -102,7 +118,7 @@ class MainApp(npyscreen.NPSAppManaged):
             kwargs.get("msg", "Exit Application?"), title=""
         )
         if value is True:
-            self.thread_stop.set()
+            self.stop_auto_save()
             while self._auto_save_active is True:
                 time.sleep(0.1)
             self.setNextForm(None)
@@ -133,12 +149,17 @@ class MainApp(npyscreen.NPSAppManaged):
         return None
 
     def _auto_save(self) -> None:
-        """Auto save the current configuration."""
+        """Auto save the configuration once the user stopped editing."""
         self._auto_save_active = True
         while not self.thread_stop.is_set():
-            time.sleep(0.5)
+            self._dirty.wait()
+            idle = time.monotonic() - self._last_edit
+            while idle < self.save_delay and not self.thread_stop.is_set():
+                self.thread_stop.wait(self.save_delay - idle)
+                idle = time.monotonic() - self._last_edit
             if self.thread_stop.is_set():
                 break
+            self._dirty.clear()
             try:
                 self.check_missing_config(stop_at_missing=False)
                 self.save_config_to_file()
@@ -186,7 +207,8 @@ class MainApp(npyscreen.NPSAppManaged):
     def save_config_to_file(self, **kwargs) -> Path | None:
         """Save the status of the tui to file."""
         try:
-            return self._save_config_to_file(**kwargs)
+            with self._save_lock:
+                return self._save_config_to_file(**kwargs)
         except Exception as error:
             npyscreen.notify_confirm(
                 title="Error",
@@ -253,8 +275,7 @@ class MainApp(npyscreen.NPSAppManaged):
                 "secrets_file": self._setup_form.secrets_file.value,
             },
         }
-        with open(self.cache_dir / "freva_deployment.json", "w") as f:
-            json.dump({k: v for (k, v) in config.items()}, f, indent=3)
+        self.write_cache(config)
         if write_toml_file is False:
             return None
 
@@ -297,14 +318,44 @@ class MainApp(npyscreen.NPSAppManaged):
         """The user cachedir."""
         return Path(appdirs.user_cache_dir()) / "freva-deployment"
 
+    @property
+    def cache_file(self) -> Path:
+        """The file holding the status of the tui."""
+        return self.cache_dir / "freva_deployment.json"
+
+    @property
+    def _cache(self) -> dict[str, Any]:
+        """The content of the cache file, it is only read once."""
+        if getattr(self, "_cache_content", None) is None:
+            try:
+                self._cache_text = self.cache_file.read_text()
+                self._cache_content = json.loads(self._cache_text)
+            except (FileNotFoundError, json.decoder.JSONDecodeError):
+                self._cache_text, self._cache_content = "", {}
+        return cast(Dict[str, Any], self._cache_content)
+
+    def write_cache(self, config: dict[str, Any]) -> None:
+        """Save the status of the tui, if it has changed.
+
+        The status is written to a temporary file first, which then replaces
+        the cache file. This way the cache file is never left half written.
+        """
+        text = json.dumps(config, indent=3)
+        with self._save_lock:
+            _ = self._cache
+            if text == self._cache_text:
+                return
+            temp_file = self.cache_file.with_suffix(f".{os.getpid()}.tmp")
+            temp_file.write_text(text)
+            temp_file.replace(self.cache_file)
+            self._cache_text, self._cache_content = text, json.loads(text)
+
     def _read_cache(
         self, key: str, default: str | list | bool | dict[str, str] = ""
     ) -> str | bool | list | dict[str, str]:
-        try:
-            with open(self.cache_dir / "freva_deployment.json", "r") as f:
-                return json.load(f).get(key, default)
-        except (FileNotFoundError, json.decoder.JSONDecodeError):
-            return default
+        return cast(
+            "str | bool | list | dict[str, str]", self._cache.get(key, default)
+        )
 
     @property
     def _steps(self) -> list[str]:
@@ -11,6 +11,7 @@ import shutil
 import socket
 import sys
 import sysconfig
+from copy import deepcopy
 from pathlib import Path
 from typing import Any, Dict, MutableMapping, NamedTuple, Optional, Union, cast
 from urllib.request import urlopen
@@ -24,7 +25,6 @@ from tomlkit.container import OutOfOrderTableProxy
 from tomlkit.items import Table
 
 from .error import ConfigurationError
-from .keys import RandomKeys
 from .logger import logger
 
 RichConsole = Console(markup=True, force_terminal=True)
@@ -199,6 +199,18 @@ def is_localhost(host: str) -> bool:
     return str(ip) in local_addrs
 
 
+def is_interactive() -> bool:
+    """Check if the deployment can ask the user for confirmation.
+
+    The deployment is non-interactive if stdin is not a terminal or the
+    ``INTERACTIVE_DEPLOY`` environment variable is set to ``0``.
+    """
+    interactive = os.getenv("INTERACTIVE_DEPLOY", "1").strip().lower()
+    if interactive in ("0", "false", "no", "off", ""):
+        return False
+    return sys.stdin is not None and sys.stdin.isatty()
+
+
 def get_cache_information(
     redis_host: Optional[str] = None,
     redis_port: Optional[str] = None,
@@ -208,6 +220,8 @@ def get_cache_information(
     """Create all information we need to setup the redis cache and the data portal."""
     user = ssl_cert = ssl_key = ""
     if redis_host:
+        from .keys import RandomKeys
+
         keys = RandomKeys(common_name=redis_host.rpartition("//")[-1].partition(":")[0])
         user = petname.generate()
         ssl_cert = keys.certificate_chain.decode("utf-8")
@@ -359,6 +373,52 @@ def load_config(inp_file: str | Path, convert: bool = False) -> tomlkit.TOMLDocu
     return config
 
 
+def _get_config_digest(*files: Path | None) -> str:
+    """Create a hash from the paths and content of config files."""
+    sha = hashlib.sha256()
+    for path in files:
+        if path is not None:
+            sha.update(str(path).encode("utf-8"))
+            sha.update(path.read_bytes())
+    return sha.hexdigest()
+
+
+_parsed_configs: Dict[str, Dict[str, Any]] = {}
+
+
+def load_inventory(
+    inp_file: str | Path, secrets_file: str | Path | None = None
+) -> Dict[str, Any]:
+    """Load an inventory and its secrets into plain python objects.
+
+    This is the fast path of :py:func:`load_config` for code that doesn't
+    have to write the config back. Parsed inventories are cached, keyed by
+    the content of the inventory, secrets and variable files. Each call
+    returns a copy that can be modified.
+
+    Parameters
+    ----------
+    inp_file: str | Path
+        The inventory toml file.
+    secrets_file: str | Path, default: None
+        Toml file whose values override those of the inventory.
+
+    Returns
+    -------
+    dict: The merged inventory, variables have been replaced.
+    """
+    inp_file = Path(inp_file).expanduser().absolute()
+    secrets_path = Path(secrets_file) if secrets_file else None
+    digest = _get_config_digest(inp_file, secrets_path, Path(config_file))
+    if digest not in _parsed_configs:
+        secrets = tomlkit.loads(secrets_path.read_text()) if secrets_path else None
+        config = merge_toml_documents(load_config(inp_file, convert=True), secrets)
+        # Outdated inventories are updated when they are loaded.
+        digest = _get_config_digest(inp_file, secrets_path, Path(config_file))
+        _parsed_configs[digest] = config.unwrap()
+    return deepcopy(_parsed_configs[digest])
+
+
 def merge_toml_documents(
     *documents: tomlkit.TOMLDocument | None,
 ) -> tomlkit.TOMLDocument:
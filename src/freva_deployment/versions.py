@@ -5,18 +5,49 @@ import json
 import os
 import ssl
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
-from urllib.request import urlopen
+from typing import Any, Dict, List, Optional, cast
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
+import appdirs
 from packaging.version import Version
 from rich import print as pprint
 from rich.prompt import Prompt
 
 from .error import ConfigurationError, handled_exception
+from .logger import logger
 
 ssl_context = ssl._create_unverified_context()
 
+SERVICE_URL = (
+    "https://raw.githubusercontent.com/freva-org/freva-service-config"
+    "/refs/heads/main/{service}/requirements.txt"
+)
+SERVICES = ("mongo", "solr", "nginx", "redis")
+"""Services whose versions are defined in the freva-service-config repo."""
+
+VERSION_CACHE_FILE = (
+    Path(appdirs.user_cache_dir()) / "freva" / "deployment" / "versions.json"
+)
+"""Location of the cached service versions."""
+
+
+def _is_offline() -> bool:
+    """Check if the service versions should be looked up without network."""
+    offline = os.getenv("FREVA_DEPLOYMENT_OFFLINE", "0").lower()
+    return offline in ("1", "true", "yes", "on")
+
+
+def _cache_ttl() -> float:
+    """Get the time in seconds after which cached versions are revalidated."""
+    try:
+        return float(os.getenv("FREVA_DEPLOYMENT_VERSION_TTL", "86400"))
+    except ValueError:
+        return 86400.0
+
 
 class VersionAction(argparse._VersionAction):
     def __call__(
@@ -27,7 +58,13 @@ class VersionAction(argparse._VersionAction):
         option_string=None,
     ):
         version = self.version or "%(prog)s"
-        pprint(version % {"prog": parser.prog or sys.argv[1]})
+        services = ""
+        if "%(services)s" in version:
+            # Only look up the service versions if they are really needed.
+            services = display_versions()
+        pprint(
+            version % {"prog": parser.prog or sys.argv[1], "services": services}
+        )
         parser.exit()
 
 
@@ -49,33 +86,189 @@ def display_versions() -> str:
     return versions
 
 
-def _download(url: str) -> str:
+class VersionFacts:
+    """Cache of service versions that were detected on, or deployed to, hosts.
+
+    Parameters
+    ----------
+    project_name: str
+        The name of the project the facts belong to.
+    deployment_method: str
+        The deployment method, facts of other methods are ignored.
+    ttl: float, default: None
+        Time in seconds after which facts are considered outdated, defaults
+        to the ``FREVA_DEPLOYMENT_FACT_TTL`` environment variable (1 hour).
+    """
+
+    def __init__(
+        self,
+        project_name: str,
+        deployment_method: str,
+        ttl: Optional[float] = None,
+    ) -> None:
+        self.path = VERSION_CACHE_FILE.parent / "facts" / f"{project_name}.json"
+        self.deployment_method = deployment_method
+        if ttl is None:
+            try:
+                ttl = float(os.getenv("FREVA_DEPLOYMENT_FACT_TTL", "3600"))
+            except ValueError:
+                ttl = 3600.0
+        self.ttl = ttl
+        try:
+            self._facts: Dict[str, Dict[str, Any]] = json.loads(
+                self.path.read_text()
+            )
+        except (OSError, ValueError):
+            self._facts = {}
+
+    def get(self, host: str, service: str) -> Optional[str]:
+        """Get the version of a service, None if there is no recent fact."""
+        fact = self._facts.get(f"{host}:{service}", {})
+        if (
+            not fact
+            or fact.get("deployment_method") != self.deployment_method
+            or time.time() - fact.get("timestamp", 0) > self.ttl
+        ):
+            return None
+        return cast(str, fact.get("version", ""))
+
+    def set(self, host: str, service: str, version: str) -> None:
+        """Set the version of a service running on a host."""
+        self._facts[f"{host}:{service}"] = {
+            "version": version,
+            "deployment_method": self.deployment_method,
+            "timestamp": time.time(),
+        }
+
+    def save(self) -> None:
+        """Write the facts to disk."""
+        try:
+            self.path.parent.mkdir(exist_ok=True, parents=True)
+            self.path.write_text(json.dumps(self._facts, indent=3))
+        except OSError as error:
+            logger.debug("Could not write version facts: %s", error)
+
+
+def _read_version_cache() -> Dict[str, Dict[str, Any]]:
+    """Read the cached service versions."""
     try:
-        with urlopen(url, context=ssl_context) as res:
-            return res.read().decode()
+        return json.loads(VERSION_CACHE_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_version_cache(cache: Dict[str, Dict[str, Any]]) -> None:
+    """Write the service versions to the cache."""
+    try:
+        VERSION_CACHE_FILE.parent.mkdir(exist_ok=True, parents=True)
+        temp_file = VERSION_CACHE_FILE.with_suffix(".tmp")
+        temp_file.write_text(json.dumps(cache, indent=3))
+        temp_file.replace(VERSION_CACHE_FILE)
+    except OSError as error:
+        logger.debug("Could not write version cache: %s", error)
+
+
+def _parse_requirements(content: str) -> str:
+    """Get the version of the first requirement."""
+    for line in content.splitlines():
+        if not line.startswith("#") and "=" in line:
+            return line.strip().split("=")[-1]
+    return ""
+
+
+def _download(
+    service: str, cached: Optional[Dict[str, Any]] = None, timeout: float = 10
+) -> Dict[str, Any]:
+    """Download the version of a service, revalidate cached versions."""
+    cached = cached or {}
+    url = SERVICE_URL.format(service=service)
+    headers = {}
+    if cached.get("version"):
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    try:
+        with urlopen(
+            Request(url, headers=headers), context=ssl_context, timeout=timeout
+        ) as res:
+            return {
+                "version": _parse_requirements(res.read().decode()),
+                "etag": res.headers.get("ETag", ""),
+                "last_modified": res.headers.get("Last-Modified", ""),
+                "timestamp": time.time(),
+            }
+    except HTTPError as error:
+        if error.code == 304:
+            return {**cached, "timestamp": time.time()}
+        raise ConfigurationError(f"Could not download {url}: {error}")
     except Exception as error:
         raise ConfigurationError(f"Could not download {url}: {error}")
 
 
+def _get_service_versions(defaults: Dict[str, str]) -> Dict[str, str]:
+    """Get the versions of the services, use the cache where possible.
+
+    The pinned, bundled ``defaults`` are used for services that have neither
+    been downloaded nor cached.
+    """
+    cache = _read_version_cache()
+    now, ttl = time.time(), _cache_ttl()
+    outdated = [
+        s for s in SERVICES if now - cache.get(s, {}).get("timestamp", 0) > ttl
+    ]
+    if _is_offline():
+        outdated = []
+    elif outdated:
+        with ThreadPoolExecutor(max_workers=len(outdated)) as pool:
+            futures = {s: pool.submit(_download, s, cache.get(s)) for s in outdated}
+        for service, future in futures.items():
+            try:
+                cache[service] = future.result()
+            except ConfigurationError as error:
+                logger.warning(
+                    "%s, using %s version for %s",
+                    error.error,
+                    "cached" if cache.get(service, {}).get("version") else "bundled",
+                    service,
+                )
+        _write_version_cache(cache)
+    versions = {}
+    for service in SERVICES:
+        version = cache.get(service, {}).get("version") or defaults.get(service)
+        if not version or version == "latest":
+            # Floating tags would make the deployment non-reproducible.
+            raise ConfigurationError(
+                f"No pinned version for {service} available, it was neither "
+                "downloaded nor cached and isn't bundled with the deployment. "
+                "Unset FREVA_DEPLOYMENT_OFFLINE to download the versions."
+            )
+        if not cache.get(service, {}).get("version") and _is_offline():
+            logger.warning(
+                "No cached version for %s available, using bundled version %s",
+                service,
+                version,
+            )
+        versions[service] = version
+    return versions
+
+
 @handled_exception
 def get_versions(_versions: List[Dict[str, str]] = []) -> Dict[str, str]:
-    """Read the necessary versions of microservices."""
+    """Read the necessary versions of microservices.
+
+    The versions of the services that are defined in the freva-service-config
+    repository are cached, the cache is revalidated after
+    ``FREVA_DEPLOYMENT_VERSION_TTL`` seconds. Set the ``FREVA_DEPLOYMENT_OFFLINE``
+    environment variable to only use the bundled and cached versions.
+    """
     if _versions:
         return _versions[0]
 
-    _versions.append(json.loads((Path(__file__).parent / "versions.json").read_text()))
-    url = (
-        "https://raw.githubusercontent.com/freva-org/freva-service-config"
-        "/refs/heads/main/{service}/requirements.txt"
-    )
-
-    for service in ("mongo", "solr", "nginx", "redis"):
-        for line in _download(url.format(service=service)).splitlines():
-            if not line.startswith("#") and "=" in line:
-                version = line.strip().split("=")[-1]
-                _versions[0][service] = version
-                break
-    _versions[0]["mongodb_server"] = _versions[0].pop("mongo")
+    versions = json.loads((Path(__file__).parent / "versions.json").read_text())
+    versions.update(_get_service_versions(versions))
+    versions["mongodb_server"] = versions.pop("mongo")
+    _versions.append(versions)
     return _versions[0]
 
 
@@ -91,6 +284,8 @@ def get_steps_from_versions(detected_versions: Dict[str, str]) -> List[str]:
     -------
     list: A list of services that should be updated.
     """
+    from .utils import is_interactive
+
     minimum_version = get_versions()
     steps = []
     for service in ("web", "vault", "freva_rest"):
@@ -109,7 +304,7 @@ def get_steps_from_versions(detected_versions: Dict[str, str]) -> List[str]:
             # We do have a problem: an installed version has a higher version
             # the the defined minimum version, possibly the deployment
             # software is outdated.
-            if os.environ.get("INTERACTIVE_DEPLOY", "1"):
+            if is_interactive():
                 answ = (
                     Prompt.ask(
                         f"The installed version for [green]{service}[/green] is higher"
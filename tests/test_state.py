@@ -0,0 +1,49 @@
+"""Tests for the fingerprints of the deployment steps."""
+
+from pathlib import Path
+from typing import Dict
+
+import pytest
+import tomlkit
+
+from freva_deployment.deploy import DeployFactory
+from freva_deployment.utils import asset_dir
+
+STEPS = ["db", "freva_rest", "web", "core"]
+
+
+@pytest.fixture
+def config_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Create a deployment config in a temporary directory."""
+    monkeypatch.setenv("MASTER_PASSWD", "Freva_test_1234")
+    monkeypatch.setenv("FREVA_DEPLOYMENT_OFFLINE", "1")
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "inventory.toml"
+    path.write_text((asset_dir / "config" / "inventory.toml").read_text())
+    return path
+
+
+def _get_step_hashes(config_file: Path) -> Dict[str, str]:
+    """Parse the config like a deployment run would do."""
+    factory = DeployFactory(steps=STEPS, config_file=config_file, gen_keys=True)
+    factory.parse_config(factory.steps)
+    return factory.step_hashes
+
+
+def test_step_hashes_are_reproducible(config_file: Path) -> None:
+    """Two runs with the same config must create the same fingerprints."""
+    first = _get_step_hashes(config_file)
+    second = _get_step_hashes(config_file)
+    assert sorted(first) == sorted(STEPS)
+    assert first == second
+
+
+def test_step_hashes_follow_config_changes(config_file: Path) -> None:
+    """Changing the config of a step must change its fingerprint."""
+    before = _get_step_hashes(config_file)
+    config = tomlkit.parse(config_file.read_text())
+    config["web"]["main_color"] = "Teal"
+    config_file.write_text(tomlkit.dumps(config))
+    after = _get_step_hashes(config_file)
+    assert before["web"] != after["web"]
+    assert before["core"] == after["core"]